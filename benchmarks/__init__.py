@@ -0,0 +1,103 @@
+"""
+Benchmarks of ConfigTree.  They are not a part of the distribution
+and should be run from the repository root, e.g.::
+
+    $ python -m benchmarks.source
+    $ python -m benchmarks.startup
+    $ python -m benchmarks.tree
+    $ python -m benchmarks.memory
+    $ python -m benchmarks.updater
+    $ python -m benchmarks.suite
+
+"""
+
+import os
+import json
+import timeit
+
+
+root_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def measure(stmt, number):
+    """
+    Returns the best time of three runs of ``stmt`` in seconds per call
+
+    :param callable stmt: Benchmarked function
+    :param int number: Number of calls within each run
+
+    """
+    return min(timeit.repeat(stmt, number=number, repeat=3)) / number
+
+
+def generate(path, dirs=10, files=10, keys=100, depth=2, envs=0, density=0.25):
+    """
+    Generates synthetic configuration tree of JSON files
+
+    Each directory contains ``files`` files, and each file contains
+    ``keys`` keys nested by ``depth`` levels, ten keys per innermost branch.
+    The ``density`` fraction of values are expressions that refer
+    to the previous key of the branch.
+
+    If ``envs`` is positive, nested environment directories ``env-l0/env-l1/...``
+    are generated too, see :func:`environment`.  Each one contains a file
+    per directory, which overrides every tenth key of its files.
+
+    :param str path: Path to directory to generate tree into
+    :param int dirs: Number of directories
+    :param int files: Number of files in each directory
+    :param int keys: Number of keys in each file
+    :param int depth: Nesting depth of keys within file
+    :param int envs: Number of environment layers
+    :param float density: Fraction of expressions among values
+
+    """
+
+    def key_path(k):
+        sections = ["section%02d" % (k // 10 ** j) for j in range(depth - 1, 0, -1)]
+        return sections + ["key%03d" % k]
+
+    def put(data, parts, value):
+        for part in parts[:-1]:
+            data = data.setdefault(part, {})
+        data[parts[-1]] = value
+
+    def dump(name, data):
+        with open(name, "w") as fileobj:
+            json.dump(data, fileobj)
+
+    for d in range(dirs):
+        directory = os.path.join(path, "dir%03d" % d)
+        os.makedirs(directory)
+        for f in range(files):
+            data = {}
+            for k in range(keys):
+                if k % 10 and int((k + 1) * density) > int(k * density):
+                    value = "$>> {branch[key%03d]}-%d" % (k - 1, k)
+                else:
+                    value = "value %d of %d/%d" % (k, d, f)
+                put(data, key_path(k), value)
+            name = os.path.join(directory, "file%03d.json" % f)
+            dump(name, {"d%03d" % d: {"f%03d" % f: data}})
+
+    layer = path
+    for e in range(envs):
+        layer = os.path.join(layer, "env-l%d" % e)
+        os.makedirs(layer)
+        for d in range(dirs):
+            data = {}
+            for f in range(files):
+                for k in range(0, keys, 10):
+                    put(data, ["f%03d" % f] + key_path(k), "layer %d" % e)
+            dump(os.path.join(layer, "dir%03d.json" % d), {"d%03d" % d: data})
+
+
+def environment(envs):
+    """
+    Returns ``env`` parameter of :class:`configtree.loader.Walker`
+    that includes all environment layers generated by :func:`generate`
+
+    :param int envs: Number of environment layers
+
+    """
+    return ".".join("l%d" % e for e in range(envs))
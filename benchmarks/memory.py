@@ -0,0 +1,41 @@
+"""
+Measures peak memory allocated by Python during load of synthetic
+configuration tree using :mod:`tracemalloc`::
+
+    $ python -m benchmarks.memory [dirs] [files] [keys]
+
+"""
+
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from configtree import Loader
+
+from . import generate
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    dirs, files, keys = [int(arg) for arg in argv] or [20, 20, 100]
+    path = tempfile.mkdtemp()
+    try:
+        generate(path, dirs, files, keys)
+        load = Loader()
+        print("Loading %d files of %d keys" % (dirs * files, keys))
+
+        tracemalloc.start()
+        tree = load(path)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(path)
+
+    print("keys      %10d" % len(tree))
+    print("current   %10.1f MiB" % (current / 1024.0 / 1024))
+    print("peak      %10.1f MiB" % (peak / 1024.0 / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Compares YAML backends of :func:`configtree.source.from_yaml`
+on YAML files of the test fixture and demo trees::
+
+    $ python -m benchmarks.source [number]
+
+"""
+
+import os
+import sys
+
+from configtree import source
+
+from . import root_dir, measure
+
+
+def fixtures():
+    """ Returns contents of YAML files of the test fixture and demo trees """
+    result = []
+    for directory in ("tests", "demo"):
+        for path, _, names in os.walk(os.path.join(root_dir, directory)):
+            for name in sorted(names):
+                if os.path.splitext(name)[1] in (".yaml", ".yml"):
+                    with open(os.path.join(path, name)) as f:
+                        result.append(f.read())
+    return result
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    number = int(argv[0]) if argv else 100
+    data = fixtures()
+    print("Loading %d YAML files, %d times" % (len(data), number))
+
+    results = {}
+    for backend in sorted(source.yaml_loaders):
+
+        def load(backend=backend):
+            for item in data:
+                source.from_yaml(item, backend=backend)
+
+        results[backend] = measure(load, number)
+        print("%-8s %8.3f ms" % (backend, results[backend] * 1000))
+    if "c" in results:
+        print("speedup  %8.1fx" % (results["python"] / results["c"]))
+    else:
+        print("libyaml is not available")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Measures startup time of ``import configtree`` and ``ctdump --version``
+in fresh interpreters.  Bare interpreter startup is measured as a baseline::
+
+    $ python -m benchmarks.startup [number]
+
+"""
+
+import subprocess
+import sys
+
+from . import root_dir, measure
+
+
+commands = [
+    ("python", "pass"),
+    ("import configtree", "import configtree"),
+    (
+        "ctdump --version",
+        "import sys; from configtree.script import ctdump; "
+        "sys.argv = ['ctdump', '--version']; ctdump()",
+    ),
+]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    number = int(argv[0]) if argv else 10
+    print("Starting interpreter %d times" % number)
+
+    for name, code in commands:
+
+        def run(code=code):
+            subprocess.check_call(
+                [sys.executable, "-c", code], cwd=root_dir, stdout=subprocess.PIPE
+            )
+
+        print("%-18s %8.1f ms" % (name, measure(run, number) * 1000))
+
+
+if __name__ == "__main__":
+    main()
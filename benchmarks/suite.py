@@ -0,0 +1,211 @@
+"""
+Measures each stage of loading and formatting of synthetic configuration
+tree, see :func:`benchmarks.generate`::
+
+    $ python -m benchmarks.suite --save results.json
+    $ python -m benchmarks.suite --compare results.json
+
+Results are saved as JSON.  Comparison against saved results prints ratio
+of each stage, and exits with status ``1``, if any stage is slower than
+the saved one by more than ``--threshold``.  Run ``--help`` to get options
+of the generated tree.
+
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+from timeit import default_timer as timer
+
+from configtree import formatter
+from configtree.loader import Walker, Updater, PostProcessor
+from configtree.tree import Tree, flatten, rarefy
+
+from . import generate, environment
+
+
+stages = [
+    "walk",
+    "flatten",
+    "insert",
+    "update",
+    "postprocess",
+    "rarefy",
+    "to_json",
+    "to_shell",
+]
+
+
+def best(run, prepare=None, number=5):
+    """
+    Returns the best time of ``run`` calls in seconds.  Unlike
+    :func:`benchmarks.measure`, it calls ``prepare`` before each call,
+    and passes its result into ``run``, so that the preparation is not timed.
+
+    :param callable run: Benchmarked function
+    :param callable prepare: Function that prepares argument of ``run``
+    :param int number: Number of calls
+
+    """
+    result = None
+    for _ in range(number):
+        argument = prepare() if prepare is not None else None
+        start = timer()
+        run(argument)
+        elapsed = timer() - start
+        if result is None or elapsed < result:
+            result = elapsed
+    return result
+
+
+def run(params, number=5):
+    """
+    Generates the tree using ``params``, and returns dictionary of stages
+    to their best times in seconds
+
+    :param dict params: Keyword arguments of :func:`benchmarks.generate`
+    :param int number: Number of calls of each stage
+
+    """
+    results = {}
+    path = tempfile.mkdtemp()
+    try:
+        generate(path, **params)
+        walk = Walker(env=environment(params["envs"]))
+        results["walk"] = best(lambda _: list(walk(path)), number=number)
+        sources = []
+        for f in walk(path):
+            with open(f) as fileobj:
+                sources.append((f, json.load(fileobj)))
+    finally:
+        shutil.rmtree(path)
+    pairs = [(f, list(flatten(data))) for f, data in sources]
+
+    def flatten_sources(_):
+        for _, data in sources:
+            for _ in flatten(data):
+                pass
+
+    def insert(tree):
+        for _, items in pairs:
+            for key, value in items:
+                tree[key] = value
+
+    def update(tree):
+        updater = Updater()
+        for f, items in pairs:
+            for key, value in items:
+                updater(tree, key, value, f)
+        return tree
+
+    tree = update(Tree())
+    PostProcessor()(tree)
+
+    results["flatten"] = best(flatten_sources, number=number)
+    results["insert"] = best(insert, Tree, number)
+    results["update"] = best(update, Tree, number)
+    results["postprocess"] = best(PostProcessor(), lambda: update(Tree()), number)
+    results["rarefy"] = best(lambda _: rarefy(tree), number=number)
+    results["to_json"] = best(lambda _: formatter.to_json(tree), number=number)
+    results["to_shell"] = best(lambda _: formatter.to_shell(tree), number=number)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints ratio of each stage time to the baseline one, and returns
+    list of stages, which are slower by more than ``threshold``
+
+    :param dict results: Current results, see :func:`main`
+    :param dict baseline: Saved results
+    :param float threshold: Allowed slowdown, e.g. ``0.1`` is 10%
+
+    """
+    if results["params"] != baseline["params"]:
+        print("Warning: baseline is measured on other tree %r" % baseline["params"])
+    regressions = []
+    print("%-12s %12s %12s %8s" % ("stage", "baseline, ms", "current, ms", "ratio"))
+    for stage in stages:
+        if stage not in baseline["stages"]:
+            continue
+        old, new = baseline["stages"][stage], results["stages"][stage]
+        ratio = new / old if old else float("inf")
+        mark = ""
+        if ratio > 1 + threshold:
+            regressions.append(stage)
+            mark = "  slower"
+        print(
+            "%-12s %12.3f %12.3f %7.2fx%s"
+            % (stage, old * 1000, new * 1000, ratio, mark)
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.suite",
+        description="measure stages of loading synthetic configuration tree",
+    )
+    parser.add_argument("--dirs", type=int, default=10, help="number of directories")
+    parser.add_argument("--files", type=int, default=10, help="files per directory")
+    parser.add_argument("--keys", type=int, default=100, help="keys per file")
+    parser.add_argument("--depth", type=int, default=2, help="nesting depth of keys")
+    parser.add_argument("--envs", type=int, default=0, help="environment layers")
+    parser.add_argument(
+        "--density", type=float, default=0.25, help="fraction of expressions"
+    )
+    parser.add_argument("--number", type=int, default=5, help="runs of each stage")
+    parser.add_argument("--save", metavar="<path>", help="save results as JSON")
+    parser.add_argument(
+        "--compare", metavar="<path>", help="compare results against saved ones"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="allowed slowdown against saved results (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    params = dict(
+        dirs=args.dirs,
+        files=args.files,
+        keys=args.keys,
+        depth=args.depth,
+        envs=args.envs,
+        density=args.density,
+    )
+    print(
+        "Measuring %d files of %d keys, %d environment layers"
+        % (args.dirs * args.files, args.keys, args.envs)
+    )
+    results = {
+        "params": params,
+        "python": platform.python_version(),
+        "stages": run(params, args.number),
+    }
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+    else:
+        regressions = []
+        for stage in stages:
+            print("%-12s %10.3f ms" % (stage, results["stages"][stage] * 1000))
+
+    if args.save:
+        directory = os.path.dirname(args.save)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
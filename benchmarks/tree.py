@@ -0,0 +1,82 @@
+"""
+Compares :func:`configtree.tree.flatten` and :func:`configtree.tree.rarefy`
+against their former recursive versions on wide and deep inputs::
+
+    $ python -m benchmarks.tree [number]
+
+"""
+
+import sys
+
+from configtree.compat.colabc import Mapping
+from configtree.tree import flatten, rarefy
+
+from . import measure
+
+
+def recursive_flatten(d):
+    """ Former recursive version of :func:`configtree.tree.flatten` """
+    for key, value in d.items():
+        if isinstance(value, Mapping):
+            for subkey, subvalue in recursive_flatten(value):
+                yield "{0}.{1}".format(key, subkey), subvalue
+        else:
+            yield str(key), value
+
+
+def recursive_rarefy(tree):
+    """ Former recursive version of :func:`configtree.tree.rarefy` """
+    result = {}
+    for key, value in tree.items():
+        target = result
+        if "." in key:
+            keyparts = key.split(".")
+            key = keyparts.pop()
+            for keypart in keyparts:
+                target = target.setdefault(keypart, {})
+        if isinstance(value, Mapping):
+            value = recursive_rarefy(value)
+        target[key] = value
+    return result
+
+
+def wide(width=50, depth=3):
+    """ Returns nested mapping with ``width`` keys on each of ``depth`` levels """
+    if depth == 1:
+        return dict(("key%d" % i, i) for i in range(width))
+    return dict(("key%d" % i, wide(width, depth - 1)) for i in range(width))
+
+
+def deep(depth=500, width=10):
+    """ Returns nested mapping of ``depth`` levels with ``width`` leaves on each """
+    result = {}
+    for level in range(depth):
+        nested = dict(("key%d" % i, level) for i in range(width))
+        nested["nested"] = result
+        result = nested
+    return result
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    number = int(argv[0]) if argv else 10
+    inputs = [("wide", wide()), ("deep", deep())]
+    print("Running each function %d times" % number)
+
+    for name, nested in inputs:
+        flat = dict(flatten(nested))
+        print("%s: %d keys" % (name, len(flat)))
+        for title, old, new, data in [
+            ("flatten", recursive_flatten, flatten, nested),
+            ("rarefy", recursive_rarefy, rarefy, flat),
+        ]:
+            before = measure(lambda: list(old(data)), number)
+            after = measure(lambda: list(new(data)), number)
+            print(
+                "  %-8s %10.3f ms %10.3f ms %6.1fx"
+                % (title, before * 1000, after * 1000, before / after)
+            )
+
+
+if __name__ == "__main__":
+    main()
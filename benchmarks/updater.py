@@ -0,0 +1,53 @@
+"""
+Compares :class:`configtree.loader.Updater` dispatching keys to triggered
+workers against passing each key through the whole pipeline.
+Every twentieth value of the input is an expression::
+
+    $ python -m benchmarks.updater [number]
+
+"""
+
+import sys
+
+from configtree.loader import Updater
+from configtree.tree import Tree
+
+from . import measure
+
+
+def pairs(count=10000):
+    """ Returns key-value pairs, 95% of which are plain ones """
+    result = []
+    for i in range(count):
+        key = "section%d.key%d" % (i // 100, i)
+        if i % 20 == 19:
+            result.append((key, "$>> {branch[key%d]}" % (i - 1)))
+        else:
+            result.append((key, "value %d" % i))
+    return result
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    number = int(argv[0]) if argv else 10
+    data = pairs()
+    print("Updating tree by %d keys, %d times" % (len(data), number))
+
+    results = {}
+    for name, dispatch in (("pipeline", False), ("dispatch", True)):
+        update = Updater()
+        if not dispatch:
+            update._dispatch = None  # Force the whole pipeline for each key
+
+        def run(update=update):
+            tree = Tree()
+            for key, value in data:
+                update(tree, key, value, "/benchmark/source.yaml")
+
+        results[name] = measure(run, number)
+        print("%-8s %8.3f ms" % (name, results[name] * 1000))
+    print("speedup  %8.1fx" % (results["pipeline"] / results["dispatch"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 import logging
 
-from .tree import ITree, Tree, flatten, rarefy
-from .loader import Loader, Walker, Updater, PostProcessor, Pipeline
+from .tree import ITree, Tree, FrozenTree, LayeredTree, flatten, rarefy
+from .loader import Loader, Walker, Updater, PostProcessor, Pipeline, SourceCache
+from .loader import LazyTree, Profiler
 
 
 __all__ = [
     "ITree",
     "Tree",
+    "FrozenTree",
+    "LayeredTree",
     "flatten",
     "rarefy",
     "Loader",
@@ -14,6 +17,9 @@ __all__ = [
     "Updater",
     "PostProcessor",
     "Pipeline",
+    "SourceCache",
+    "LazyTree",
+    "Profiler",
 ]
 __version__ = "0.6"
 __author__ = "Cottonwood Technology <info@cottonwood.tech>"
@@ -0,0 +1,67 @@
+from .colabc import MutableMapping
+
+
+def iter_entry_points(group):
+    """
+    Yields entry points of the ``group`` using :mod:`importlib.metadata`,
+    or :mod:`pkg_resources` on Python versions, where it is not available
+
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # pragma: no cover
+        from pkg_resources import iter_entry_points as legacy_entry_points
+
+        for entry_point in legacy_entry_points(group):
+            yield entry_point
+        return
+
+    found = entry_points()
+    if hasattr(found, "select"):
+        found = found.select(group=group)
+    else:  # pragma: no cover
+        found = found.get(group, [])
+    for entry_point in found:
+        yield entry_point
+
+
+class EntryPointMap(MutableMapping):
+    """
+    Dictionary that is filled using entry points of the ``group``
+    on first access to it, instead of import time
+
+    """
+
+    def __init__(self, group):
+        self.group = group
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            data = {}
+            for entry_point in iter_entry_points(self.group):
+                data[entry_point.name] = entry_point.load()
+            self._data = data
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __repr__(self):
+        return "{0}({1!r})".format(self.__class__.__name__, self.data)
@@ -0,0 +1,75 @@
+import os
+import stat
+
+try:
+    _scandir = os.scandir
+except AttributeError:  # pragma: no cover
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
+
+
+def _rename(src, dst):
+    """
+    Emulation of :func:`os.replace` for Python 2.7.  On Windows,
+    :func:`os.rename` fails if ``dst`` exists, so it is removed first.
+    Unlike :func:`os.replace`, the replacement is not atomic there.
+
+    """
+    try:
+        os.rename(src, dst)
+    except OSError:
+        if os.name != "nt" or not os.path.exists(dst):
+            raise
+        os.remove(dst)
+        os.rename(src, dst)
+
+
+replace = getattr(os, "replace", _rename)
+
+def scandir(path):
+    """
+    Returns list of entries of directory ``path`` using :func:`os.scandir`,
+    or ``scandir`` backport on Python 2.7.  If the backport is not installed,
+    entries are emulated by :class:`DirEntry` using :func:`os.listdir`.
+
+    """
+    if _scandir is None:  # pragma: no cover
+        return [DirEntry(path, name) for name in os.listdir(path)]
+    entries = _scandir(path)
+    try:
+        return list(entries)
+    finally:
+        # Iterator can be closed since Python 3.6
+        if hasattr(entries, "close"):
+            entries.close()
+
+
+class DirEntry(object):
+    """
+    Emulation of :class:`os.DirEntry`, which makes single stat call
+    on the first check of the entry type
+
+    """
+
+    __slots__ = ("name", "path", "_mode")
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._mode = None
+
+    def _stat(self):
+        if self._mode is None:
+            try:
+                self._mode = os.stat(self.path).st_mode
+            except OSError:
+                self._mode = 0
+        return self._mode
+
+    def is_dir(self):
+        return stat.S_ISDIR(self._stat())
+
+    def is_file(self):
+        return stat.S_ISREG(self._stat())
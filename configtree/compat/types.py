@@ -1,4 +1,5 @@
 import sys
+from collections import OrderedDict
 
 
 if sys.version_info[0] > 2:  # pragma: no cover
@@ -9,3 +10,10 @@ else:  # pragma: no cover
     chars = (unicode, bytes)  # noqa
     string = unicode  # noqa
     basestr = basestring  # noqa
+
+
+if sys.version_info >= (3, 7):  # pragma: no cover
+    # Built-in dictionary keeps insertion order
+    odict = dict
+else:  # pragma: no cover
+    odict = OrderedDict
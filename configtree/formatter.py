@@ -4,8 +4,9 @@ The module provides formatters of :class:`configtree.tree.Tree` objects
 ..  data:: map
 
     Dictionary that stores map of formatters.  It is filled using
-    `entry points`_ named ``configtree.formatter``.  But can be also modified
-    within ``loaderconf.py`` module to add ad hoc formatter.
+    `entry points`_ named ``configtree.formatter`` on first access to it.
+    But can be also modified within ``loaderconf.py`` module to add
+    ad hoc formatter.
     See :mod:`configtree.loader`.
 
     The map is used by script :func:`configtree.script.ctdump` to load
@@ -18,13 +19,17 @@ The module provides formatters of :class:`configtree.tree.Tree` objects
 """
 
 import json
+from io import BytesIO
 from os import linesep
-from pkg_resources import iter_entry_points
 from numbers import Number
 
-from .tree import rarefy
+from .tree import ITree, FrozenTree, rarefy
 from .compat.types import string, chars
 from .compat.colabc import Mapping, Sequence
+from .compat.entrypoints import EntryPointMap
+
+# Trees, which provide first level items by ``rare_items()``
+_trees = (ITree, FrozenTree)
 
 
 def option(name, **kw):
@@ -50,6 +55,36 @@ def option(name, **kw):
     return decorator
 
 
+def streaming(f):
+    """
+    Decorator that marks formatter as streaming one, i.e. it accepts
+    keyword argument ``out``.  If the argument is passed, the formatter writes
+    result into file object ``out`` piece by piece instead of returning
+    a string.
+
+    The mark is used by script :func:`configtree.script.ctdump` to write
+    result directly into standard output.
+
+    """
+    f.__streaming__ = True
+    return f
+
+
+def fingerprinted(f):
+    """
+    Decorator that marks formatter, which accepts keyword argument
+    ``fingerprint``, i.e. hash of source files of the tree,
+    see :meth:`configtree.loader.Loader.fingerprint`.
+
+    The mark is used by script :func:`configtree.script.ctdump` to pass
+    fingerprint of loaded files into formatter.
+
+    """
+    f.__fingerprinted__ = True
+    return f
+
+
+@streaming
 @option("rare", action="store_true", help="rarefy tree (default: %(default)s)")
 @option("sort", action="store_true", help="sort keys (default: %(default)s)")
 @option(
@@ -59,7 +94,7 @@ def option(name, **kw):
     metavar="<indent>",
     help="indent size (default: %(default)s)",
 )
-def to_json(tree, rare=False, indent=None, sort=False):
+def to_json(tree, rare=False, indent=None, sort=False, out=None):
     """
     Format ``tree`` into JSON
 
@@ -67,6 +102,8 @@ def to_json(tree, rare=False, indent=None, sort=False):
     :param bool rare: Use :func:`configtree.tree.rarefy` on tree before format
     :param int indent: Indent size
     :param bool sort: Sort keys
+    :param out: File object to write result into.  If it is passed,
+                the function returns ``None``.
 
     Examples:
 
@@ -91,14 +128,69 @@ def to_json(tree, rare=False, indent=None, sort=False):
         }
 
     """
+    encoder = json.JSONEncoder(indent=indent, sort_keys=sort)
     if isinstance(tree, Mapping):
-        if rare:
+        if rare and not isinstance(tree, _trees):
             tree = rarefy(tree)
-        else:
-            tree = dict(tree)
-    return json.dumps(tree, indent=indent, sort_keys=sort)
+        chunks = _iter_json(tree, encoder, rare, sort, 0)
+    else:
+        chunks = [encoder.encode(tree)]
+    return _output(chunks, out)
+
+
+def _iter_json(tree, encoder, rare, sort, level):
+    """
+    Yields JSON chunks of mapping ``tree`` item by item.
+
+    Branches of trees, see :class:`configtree.tree.ITree` and
+    :class:`configtree.tree.FrozenTree`, are written recursively
+    in rare mode, other values are encoded as a whole.  The result is the same
+    as of :func:`json.dumps` of :func:`configtree.tree.rarefy` or :class:`dict`
+    of the tree.
+
+    """
+    items = tree.rare_items() if rare and isinstance(tree, _trees) else tree.items()
+    if sort:
+        items = sorted(items, key=lambda item: item[0])
+    if encoder.indent is None:
+        newline = ""
+        separator = ", "
+    else:
+        newline = "\n" + " " * (encoder.indent * (level + 1))
+        separator = ","
+    empty = True
+    for key, value in items:
+        yield ("{" if empty else separator) + newline + json.dumps(key) + ": "
+        empty = False
+        if rare and isinstance(value, _trees):
+            for chunk in _iter_json(value, encoder, rare, sort, level + 1):
+                yield chunk
+            continue
+        if rare and isinstance(value, Mapping):
+            value = rarefy(value)
+        value = encoder.encode(value)
+        if newline:
+            value = value.replace("\n", newline)
+        yield value
+    if empty:
+        yield "{}"
+    else:
+        yield newline[: len(newline) - (encoder.indent or 0)] + "}"
+
+
+def _output(chunks, out):
+    """
+    Writes ``chunks`` into file object ``out``, or joins them into a string
+    and returns it, if ``out`` is ``None``
+
+    """
+    if out is None:
+        return u"".join(chunks)
+    for chunk in chunks:
+        out.write(chunk)
 
 
+@streaming
 @option(
     "prefix", default="", metavar="<prefix>", help="key prefix (default: empty string)"
 )
@@ -112,7 +204,7 @@ def to_json(tree, rare=False, indent=None, sort=False):
 @option(
     "capitalize", action="store_true", help="capitalize keys (default: %(default)s)"
 )
-def to_shell(tree, prefix="", seq_sep=" ", sort=False, capitalize=False):
+def to_shell(tree, prefix="", seq_sep=" ", sort=False, capitalize=False, out=None):
     """
     Format ``tree`` into shell (Bash) expression format
 
@@ -121,6 +213,8 @@ def to_shell(tree, prefix="", seq_sep=" ", sort=False, capitalize=False):
     :param str seq_sep: Sequence items separator
     :param bool sort: Sort keys
     :param bool capitalize: Capitalize keys
+    :param out: File object to write result into.  If it is passed,
+                the function returns ``None``.
 
     Examples:
 
@@ -161,25 +255,40 @@ def to_shell(tree, prefix="", seq_sep=" ", sort=False, capitalize=False):
             )
         return u"'%s'" % string(value).replace("'", "\\'")
 
-    result = []
-
-    if isinstance(tree, Mapping):
+    def lines():
+        if not isinstance(tree, Mapping):
+            yield u"%s%s" % (prefix, convert(tree))
+            return
         keys = tree.keys()
         if sort:
             keys = sorted(keys)
-        for key in keys:
+        for i, key in enumerate(keys):
             value = convert(tree[key])
             key = key.replace(tree._key_sep, "_")
             if capitalize:
                 key = key.upper()
-            result.append(u"%s%s=%s" % (prefix, key, value))
-    else:
-        value = convert(tree)
-        result.append(u"%s%s" % (prefix, value))
+            yield u"%s%s%s=%s" % (linesep if i else u"", prefix, key, value)
+
+    return _output(lines(), out)
+
+
+@fingerprinted
+def to_snapshot(tree, fingerprint=""):
+    """
+    Format ``tree`` into binary snapshot, that can be loaded
+    by :meth:`configtree.tree.Tree.load_snapshot`.
+    See :meth:`configtree.tree.ITree.dump_snapshot`.
+
+    :param Tree tree: Tree object to format
+    :param str fingerprint: Fingerprint of source files of the tree
+    :returns: Snapshot
+    :rtype: bytes
+
+    """
+    out = BytesIO()
+    tree.dump_snapshot(out, fingerprint)
+    return out.getvalue()
 
-    return linesep.join(result)
 
+map = EntryPointMap("configtree.formatter")
 
-map = {}
-for entry_point in iter_entry_points("configtree.formatter"):
-    map[entry_point.name] = entry_point.load()
@@ -1,13 +1,25 @@
 """ The module provides utility functions to load tree object from files """
 
 import os
+import re
+import ast
 import sys
+import copy
+import string
+import pickle
+import hashlib
+import threading
+import functools
+from collections import OrderedDict
+from timeit import default_timer as timer
 
 from cached_property import cached_property
 
 from . import source
 from .compat.types import basestr
-from .tree import Tree, flatten
+from .compat.colabc import MutableMapping
+from .compat.fs import scandir, replace
+from .tree import ITree, Tree, BranchProxy, LayeredTree, flatten, _void
 from itertools import chain
 
 class Loader(object):
@@ -18,14 +30,44 @@ class Loader(object):
     :param Updater update: Update actor that implements syntactic sugar
     :param PostProcessor postprocess: Result tree post processor
     :param Tree tree: Tree object that should contain result of loading
+    :param SourceCache cache: Optional cache of parsed source files
+    :param int workers: Number of processes to parse source files in parallel.
+                        It also can be an instance of
+                        :class:`concurrent.futures.Executor`, e.g. thread pool.
+                        By default, files are parsed sequentially.
+    :param Profiler profiler: Optional profiler to collect timings of loading
+    :param bool reloadable: Whether to keep state of each call
+                            for :meth:`reload` or not
 
     """
 
-    def __init__(self, walk=None, update=None, postprocess=None, tree=None):
+    def __init__(
+        self,
+        walk=None,
+        update=None,
+        postprocess=None,
+        tree=None,
+        cache=None,
+        workers=None,
+        profiler=None,
+        reloadable=False,
+    ):
         self.walk = walk or Walker()
         self.update = update or Updater()
         self.postprocess = postprocess or PostProcessor()
         self.tree = tree if tree is not None else Tree()
+        self.cache = cache
+        self.workers = workers
+        self.profiler = profiler
+        self.reloadable = reloadable
+
+        # State of the last call, see :meth:`reload`
+        self._pathlist = None
+        self._initial = None
+        self._stamps = None
+        self._definitions = None
+        # State of the call before the last one, see :meth:`_reuse`
+        self._previous = None
 
     @classmethod
     def fromconf(cls, path):
@@ -51,7 +93,16 @@ class Loader(object):
             if module_name != "loaderconf":
                 raise
             conf = {}
-        keys = ("walk", "update", "postprocess", "tree")
+        keys = (
+            "walk",
+            "update",
+            "postprocess",
+            "tree",
+            "cache",
+            "workers",
+            "profiler",
+            "reloadable",
+        )
         conf = dict((k, v) for k, v in conf.items() if k in keys)
         return cls(**conf)
 
@@ -68,29 +119,429 @@ class Loader(object):
 
         if not type(pathlist) in (tuple, list):
             pathlist=[pathlist]
-        
-        for path in pathlist:
-            logger.info('Walking over "%s"', path)
-            for f in self.walk(path):
-                relpath = os.path.relpath(f, path)
-                logger.info('Loading "%s"', relpath)
-                ext = os.path.splitext(f)[1]
-                with open(f) as data:
-                    data = source.map[ext](data)
-                    if not data:
-                        continue
-                    for key, value in flatten(data):
+
+        if self.reloadable:
+            # Values are copied deeply, because updater can change them
+            self._pathlist = pathlist
+            self._initial = copy.deepcopy(self.tree)
+            self._stamps = []
+        # Profiler is chosen once, so that disabled profiling costs nothing
+        profiler = self.profiler if self.profiler is not None else _null_profiler
+        clock = profiler.timer
+        profiler.clear()
+        for pipeline in (self.walk, self.update, self.postprocess):
+            profiler.instrument(pipeline)
+        executor = self.executor()
+        try:
+            for path in pathlist:
+                logger.info('Walking over "%s"', path)
+                start = clock()
+                files = list(self.walk(path))
+                profiler.phase("walk", clock() - start, len(files))
+                if self.reloadable:
+                    self._stamps.extend((f, self.stamp(f)) for f in files)
+                start = clock()
+                for f, pairs in self.sources(files, executor):
+                    parsed = clock()
+                    relpath = os.path.relpath(f, path)
+                    logger.info('Loading "%s"', relpath)
+                    for key, value in pairs:
                         self.update(self.tree, key, value, f)
+                    profiler.file(f, parsed - start, clock() - parsed, len(pairs))
+                    start = clock()
+        finally:
+            if executor is not None and executor is not self.workers:
+                executor.shutdown()
+        if self.cache is not None:
+            self.cache.save()
+        previous, self._previous = self._previous, None
+        reused = self._reuse(previous) if previous is not None else {}
+        if self.reloadable:
+            self._definitions = self._record()
         logger.info("Post-processing")
-        self.postprocess(self.tree)
+        profiler.watch(self.tree)
+        start = clock()
+        try:
+            self.postprocess(self.tree)
+        finally:
+            profiler.phase("postprocess", clock() - start, len(self.tree))
+        if reused:
+            logger.info("Reused %d results of expressions", len(reused))
+            for key, (dependencies, timing) in reused.items():
+                self.postprocess.graph.add(key, dependencies, timing)
         return self.tree
 
+    def reload(self):
+        """
+        Loads configuration again from the paths passed into the last call
+
+        If no source file has been added, removed, or changed since
+        the last call, the current tree is returned as is.  Otherwise,
+        the tree is loaded again starting from the state it has had
+        before the last call.  Pass :class:`SourceCache` into the loader
+        to avoid parsing of unchanged files.
+
+        Results of expressions are reused, if their source is not changed,
+        and keys they depend on have the same values,
+        see :attr:`PostProcessor.graph`.  Only expressions, which refer
+        to the tree by constant items, see :attr:`UpdateAction.references`,
+        are reused.  Any other data they use, e.g. environment variables,
+        is not taken into account.
+
+        The loader should be created with ``reloadable`` argument.
+
+        :returns: Result tree object
+        :rtype: Tree
+
+        """
+        if not self.reloadable:
+            raise ValueError("Loader is not reloadable")
+        if self._pathlist is None:
+            raise ValueError("Configuration has not been loaded yet")
+        stamps = [
+            (f, self.stamp(f)) for path in self._pathlist for f in self.walk(path)
+        ]
+        if stamps == self._stamps:
+            return self.tree
+        graph = getattr(self.postprocess, "graph", None)
+        if graph is not None:
+            self._previous = (
+                self.tree,
+                self._definitions,
+                OrderedDict(graph.dependencies),
+                dict(graph.timings),
+            )
+        self.tree = self._initial
+        return self(self._pathlist)
+
+    def _record(self):
+        """
+        Returns dictionary of keys of :attr:`tree` to definitions
+        of promises, which results can be reused by :meth:`reload`
+
+        """
+        tree = self.tree
+        pairs = Tree._pairs(tree) if isinstance(tree, Tree) else tree.items()
+        definitions = {}
+        for key, value in pairs:
+            definition = _definition(key, value)
+            if definition is not None and value.action.references is not None:
+                definitions[key] = definition
+        return definitions
+
+    def _reuse(self, previous):
+        """
+        Sets up results of promises of the previous call into :attr:`tree`,
+        if the promises have the same definitions, and their dependencies
+        have the same values.  See :meth:`reload`.
+
+        :param tuple previous: Result tree, definitions of its promises,
+                               dependencies and timings of its keys
+        :returns: Dictionary of reused keys to their dependencies and timings
+
+        """
+        tree = self.tree
+        old_tree, definitions, dependencies, timings = previous
+        # Keys to flags whether their values are not changed
+        same = {}
+
+        def unchanged(key):
+            if key not in same:
+                new, old = _raw(tree, key), _raw(old_tree, key)
+                same[key] = (
+                    not isinstance(new, (Promise, ITree))
+                    and type(new) is type(old)
+                    and new == old
+                )
+            return same[key]
+
+        graph = DependencyGraph()
+        graph.dependencies = dependencies
+        reused = OrderedDict()
+        for key in graph.order(dependencies):
+            value = _raw(tree, key)
+            if not isinstance(value, Promise):
+                unchanged(key)
+                continue
+            old = _raw(old_tree, key)
+            same[key] = (
+                definitions.get(key) is not None
+                and _definition(key, value) == definitions[key]
+                and old is not _void
+                and not isinstance(old, (Promise, ITree))
+                and all(unchanged(dependency) for dependency in dependencies[key])
+            )
+            if same[key]:
+                tree[key] = old
+                reused[key] = (dependencies[key], timings.get(key))
+        return reused
+
+    def batch(self, pathlist, envs):
+        """
+        Generates pairs of environment name and result tree loaded
+        for the environment, see :meth:`Walker.environment`
+
+        Each source file is parsed once for all the environments,
+        see :class:`SharedSources`.  Then each environment tree is updated
+        and post-processed as usual starting from the initial :attr:`tree`.
+        The walk is repeated for each environment, because it selects
+        environment specific files, but it lists directories only.
+
+        The loader should use :class:`Walker` to walk over files.
+        Its ``env`` parameter is replaced by each name of ``envs``
+        while the corresponding tree is generated.  The trees are
+        generated one by one, so that only the current one has to be kept
+        in memory.  :meth:`reload` is not available after the call.
+
+        :param str or list pathlist: Path or list of paths to directories
+                                     that contain configuration files
+        :param list envs: Names of environments
+        :returns: Iterator over pairs of environment name and result tree
+
+        """
+        params, initial, cache = self.walk.params, self.tree, self.cache
+        self.cache = SharedSources(cache)
+        try:
+            for env in envs:
+                self.walk.params = dict(params, env=env)
+                self.tree = initial.copy()
+                yield env, self(pathlist)
+        finally:
+            self.walk.params, self.tree, self.cache = params, initial, cache
+            self._pathlist = None
+
+    def fingerprint(self, pathlist):
+        """
+        Returns SHA-1 hash of relative paths and contents of source files,
+        which are found by :attr:`walk` within ``pathlist``.
+        So that it is changed, when any source file is added, removed,
+        or changed.  Changes of :ref:`loaderconf_py` and environment
+        variables are not taken into account.
+
+        :param str or list pathlist: Path or list of paths to directories
+                                     that contain configuration files
+
+        """
+        if not type(pathlist) in (tuple, list):
+            pathlist = [pathlist]
+        digest = hashlib.sha1()
+        for path in pathlist:
+            for f in self.walk(path):
+                line = "{0}\0{1}\n".format(os.path.relpath(f, path), stamp(f, True))
+                digest.update(line.encode("utf-8"))
+        return digest.hexdigest()
+
+    def load_snapshot(self, snapshot, pathlist, save=True):
+        """
+        Loads tree from ``snapshot`` file, if it has been made from current
+        source files of ``pathlist``, see :meth:`fingerprint`.  Otherwise,
+        loads configuration from ``pathlist`` as usual, and writes snapshot
+        of the result into the file, if ``save`` is true.
+
+        The snapshot contains resolved values only, so that neither source
+        files are parsed, nor expressions are evaluated, when the snapshot
+        is valid.  See :meth:`configtree.tree.Tree.load_snapshot`.
+
+        :param str snapshot: Path to snapshot file
+        :param str or list pathlist: Path or list of paths to directories
+                                     that contain configuration files
+        :param bool save: Whether to write snapshot or not
+        :returns: Result tree object
+        :rtype: Tree
+
+        """
+        from . import logger
+
+        fingerprint = self.fingerprint(pathlist)
+        try:
+            with open(snapshot, "rb") as f:
+                tree = self.tree.__class__.load_snapshot(f, fingerprint)
+        except Exception as e:
+            logger.info('Snapshot "%s" is not used: %s', snapshot, e)
+        else:
+            logger.info('Loaded snapshot "%s"', snapshot)
+            return tree
+        tree = self(pathlist)
+        if save:
+            tmpname = "{0}.{1}".format(snapshot, os.getpid())
+            with open(tmpname, "wb") as f:
+                tree.dump_snapshot(f, fingerprint)
+            replace(tmpname, snapshot)
+        return tree
+
+    def stamp(self, path):
+        """
+        Returns value that is changed, when source file is changed.
+        See :meth:`SourceCache.stamp`.
+
+        :param str path: Path to source file
+
+        """
+        if self.cache is not None:
+            return self.cache.stamp(path)
+        return stamp(path)
+
+    def executor(self):
+        """
+        Returns executor to parse source files in parallel according to
+        ``workers`` argument, or ``None`` if files should be parsed
+        sequentially.
+
+        """
+        if not self.workers:
+            return None
+        if not isinstance(self.workers, int):
+            return self.workers
+        if self.workers < 2:
+            return None
+        from concurrent.futures import ProcessPoolExecutor
+
+        return ProcessPoolExecutor(self.workers)
+
+    def sources(self, files, executor=None):
+        """
+        Generates pairs of path to source file and its flattened key-value
+        pairs in the order of passed ``files``.
+
+        If ``executor`` is passed, files that are not found in the cache
+        are parsed by the executor using loaders from
+        :data:`configtree.source.map` directly, i.e. :meth:`read` is not used.
+
+        :param iterable files: Paths to source files
+        :param executor: Executor to parse files in parallel
+        :type executor: concurrent.futures.Executor
+
+        """
+        if executor is None:
+            for f in files:
+                if self.cache is not None:
+                    yield f, self.cache(f, self.read)
+                else:
+                    yield f, self.read(f)
+            return
+
+        files = list(files)
+        cached = [None] * len(files)
+        if self.cache is not None:
+            cached = [self.cache.get(f) for f in files]
+        missed = [f for f, pairs in zip(files, cached) if pairs is None]
+        readers = [source.map[os.path.splitext(f)[1]] for f in missed]
+        workers = self.workers if isinstance(self.workers, int) else 1
+        chunksize = max(1, len(missed) // (workers * 4))
+        parsed = executor.map(read_source, readers, missed, chunksize=chunksize)
+        for f, pairs in zip(files, cached):
+            if pairs is None:
+                pairs = next(parsed)
+                if self.cache is not None:
+                    self.cache.set(f, pairs)
+            yield f, pairs
+
+    def read(self, path):
+        """
+        Reads source file using loader from :data:`configtree.source.map`
+
+        :param str path: Path to source file
+        :returns: Flattened key-value pairs
+        :rtype: list
+
+        """
+        return read_source(source.map[os.path.splitext(path)[1]], path)
+
 
 ###############################################################################
 # Utilities
 ##
 
 
+def stamp(path, checksum=False):
+    """
+    Returns value that is changed, when source file is changed
+
+    :param str path: Path to source file
+    :param bool checksum: Whether to use SHA-1 hash of file content
+                          instead of its modification time and size
+
+    """
+    if checksum:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+
+
+def _definition(key, value):
+    """
+    Returns source and original value of the update action, which has
+    created promise ``value`` of ``key``, or ``None`` if the promise
+    depends on other state of the tree, e.g. ``key#extend``
+
+    """
+    if not isinstance(value, Promise) or value.action is None:
+        return None
+    action = value.action
+    if action.key != key or action._key != key:
+        return None
+    return action.source, action._value
+
+
+def _raw(tree, key):
+    """
+    Returns value of ``key`` without processing by :class:`LazyTree`,
+    or ``_void`` if the tree has no such key
+
+    """
+    try:
+        return Tree.__getitem__(tree, key) if isinstance(tree, Tree) else tree[key]
+    except KeyError:
+        return _void
+
+
+def _shared(tree, key):
+    """
+    Returns whether value of ``key`` is taken from base tree
+    of :class:`configtree.tree.LayeredTree`, so that it must not be
+    changed in place
+
+    """
+    return isinstance(tree, LayeredTree) and key not in tree.overrides
+
+
+def copy_value(value, memo=None):
+    """
+    Returns deep copy of parsed value, or the value itself,
+    if it is immutable scalar
+
+    :param value: Value to copy
+    :param dict memo: Memo of :func:`copy.deepcopy`, which keeps values
+                      shared by several keys, e.g. YAML aliases, shared
+                      in their copies too
+
+    """
+    if value is None or isinstance(value, _scalars):
+        return value
+    return copy.deepcopy(value, memo)
+
+
+_scalars = (basestr, bool, int, float)
+
+
+def read_source(reader, path):
+    """
+    Reads source file using passed loader, see :data:`configtree.source.map`
+
+    :param callable reader: Loader of source file
+    :param str path: Path to source file
+    :returns: Flattened key-value pairs
+    :rtype: list
+
+    """
+    with open(path) as data:
+        data = reader(data)
+    if not data:
+        return []
+    return list(flatten(data))
+
+
 class Pipeline(object):
     """
     Utility class that helps to build pipelines
@@ -134,6 +585,539 @@ class Pipeline(object):
         return decorator
 
 
+class ExpressionCache(object):
+    """
+    Utility class that implements bounded LRU cache of prepared expressions
+
+    The cache is used by :class:`Updater` to prepare each distinct expression
+    only once, even if it is repeated across many source files.  When the
+    cache is full, the least recently used expression is dropped.
+
+    :param callable prepare: Callable that accepts expression source
+                             and returns its prepared form
+    :param int maxsize: Maximum number of cached expressions
+
+    ..  attribute:: hits
+
+        Number of lookups that found prepared expression in the cache
+
+    ..  attribute:: misses
+
+        Number of lookups that had to prepare expression
+
+    ..  code-block:: pycon
+
+        >>> cache = ExpressionCache(lambda source: source.upper(), maxsize=2)
+        >>> cache('a'), cache('b'), cache('a'), cache('c')
+        ('A', 'B', 'A', 'C')
+        >>> cache.hits, cache.misses, len(cache)
+        (1, 3, 2)
+
+    """
+
+    def __init__(self, prepare, maxsize=1024):
+        self.prepare = prepare
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, source):
+        """
+        Returns prepared form of ``source``.  It is safe to call it
+        from many threads.
+
+        :param str source: Expression source
+
+        """
+        with self._lock:
+            prepared = self._cache.pop(source, _void)
+            if prepared is not _void:
+                self.hits += 1
+                self._cache[source] = prepared
+                return prepared
+        prepared = self.prepare(source)
+        with self._lock:
+            self.misses += 1
+            if source not in self._cache and len(self._cache) >= self.maxsize:
+                self._cache.popitem(last=False)
+            self._cache[source] = prepared
+        return prepared
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        """ Drops all cached expressions and resets counters """
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class SourceCache(object):
+    """
+    Cache of parsed source files, see :meth:`Loader.read`
+
+    The cache stores flattened key-value pairs of each source file into
+    a single pickle file within ``path`` directory.  If ``path`` is ``None``,
+    the cache is kept in memory only, which is useful for
+    :meth:`Loader.reload`.  The pairs are reused
+    while the source file is not changed, so that the file is not parsed
+    again.  The file is treated as changed, if its modification time or size
+    is changed.  If ``checksum`` is true, SHA-1 hash of file content is used
+    instead, which is useful when modification time is not preserved,
+    e.g. on fresh checkouts within CI.
+
+    Values, which cannot be pickled, are not cached.
+
+    :param str path: Path to cache directory
+    :param bool checksum: Whether to use hash of file content or not
+
+    ..  attribute:: hits
+
+        Number of source files that have been taken from the cache
+
+    ..  attribute:: misses
+
+        Number of source files that have been parsed
+
+    """
+
+    def __init__(self, path=None, checksum=False):
+        self.path = path
+        self.checksum = checksum
+        self.hits = 0
+        self.misses = 0
+        self.modified = False
+        self._stamps = {}
+
+    @cached_property
+    def filename(self):
+        from . import __version__
+
+        return os.path.join(
+            self.path,
+            "sources-{0}-py{1}.pickle".format(__version__, sys.version_info[0]),
+        )
+
+    @cached_property
+    def entries(self):
+        if self.path is None:
+            return {}
+        try:
+            with open(self.filename, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            return {}
+
+    def stamp(self, path):
+        """
+        Returns value that is changed, when source file is changed
+
+        :param str path: Path to source file
+
+        """
+        return stamp(path, self.checksum)
+
+    def __call__(self, path, read):
+        """
+        Returns flattened key-value pairs of source file
+
+        :param str path: Path to source file
+        :param callable read: Function that parses the file,
+                              if it is not cached or changed
+
+        """
+        pairs = self.get(path)
+        if pairs is None:
+            pairs = read(path)
+            self.set(path, pairs)
+        return pairs
+
+    def get(self, path):
+        """
+        Returns cached key-value pairs of source file, or ``None``
+        if the file is not cached or changed
+
+        :param str path: Path to source file
+
+        """
+        path = os.path.realpath(path)
+        stamp = self.stamp(path)
+        self._stamps[path] = stamp
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == stamp:
+            self.hits += 1
+            return pickle.loads(entry[1])
+        self.misses += 1
+        return None
+
+    def set(self, path, pairs):
+        """
+        Puts key-value pairs of source file into the cache
+
+        :param str path: Path to source file
+        :param list pairs: Flattened key-value pairs
+
+        """
+        path = os.path.realpath(path)
+        stamp = self._stamps.pop(path, None) or self.stamp(path)
+        try:
+            data = pickle.dumps(pairs, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            self.entries.pop(path, None)
+        else:
+            self.entries[path] = (stamp, data)
+        self.modified = True
+
+    def save(self):
+        """ Writes the cache into its directory, if it has been modified """
+        if self.path is None or not self.modified:
+            return
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        tmpname = "{0}.{1}".format(self.filename, os.getpid())
+        with open(tmpname, "wb") as f:
+            pickle.dump(self.entries, f, pickle.HIGHEST_PROTOCOL)
+        replace(tmpname, self.filename)
+        self.modified = False
+
+
+class SharedSources(object):
+    """
+    In-memory cache of parsed source files, which is used by
+    :meth:`Loader.batch` to share them between environments
+
+    Unlike :class:`SourceCache`, the pairs are kept as is, and neither
+    pickled nor checked for changes.  Only mutable values are copied
+    on each use, because updater can change them in place, e.g.
+    ``key#extend``.  Files, which are missed, are taken from ``cache``,
+    if it is passed.
+
+    :param SourceCache cache: Optional underlying cache
+
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.entries = {}
+
+    def stamp(self, path):
+        """ See :meth:`SourceCache.stamp` """
+        if self.cache is not None:
+            return self.cache.stamp(path)
+        return stamp(path)
+
+    def __call__(self, path, read):
+        """ See :meth:`SourceCache.__call__` """
+        pairs = self.get(path)
+        if pairs is None:
+            pairs = read(path)
+            self.set(path, pairs)
+        return pairs
+
+    def get(self, path):
+        """ See :meth:`SourceCache.get` """
+        pairs = self.entries.get(path)
+        if pairs is None and self.cache is not None:
+            pairs = self.cache.get(path)
+            if pairs is not None:
+                self.entries[path] = pairs
+        if pairs is None:
+            return None
+        memo = {}
+        return [(key, copy_value(value, memo)) for key, value in pairs]
+
+    def set(self, path, pairs):
+        """ See :meth:`SourceCache.set` """
+        memo = {}
+        self.entries[path] = [(key, copy_value(value, memo)) for key, value in pairs]
+        if self.cache is not None:
+            self.cache.set(path, pairs)
+
+    def save(self):
+        """ Saves underlying cache, if any """
+        if self.cache is not None:
+            self.cache.save()
+
+
+class Profiler(object):
+    """
+    Collects timings of :class:`Loader` call, see ``profiler`` argument
+    of the loader.  The timings are reset on each call.
+
+    ..  code-block:: python
+
+        profiler = Profiler()
+        tree = Loader(profiler=profiler)('/path/to/configs')
+        print(profiler.format())
+
+    ..  attribute:: phases
+
+        Ordered dictionary of loading phases to ``[seconds, count]`` lists.
+        The phases are ``walk`` (count of found files), ``parse``
+        (count of parsed files), ``update`` (count of keys),
+        and ``postprocess`` (count of keys of the result tree).
+
+    ..  attribute:: files
+
+        Ordered dictionary of source files to
+        ``[parse seconds, update seconds, keys]`` lists
+
+    ..  attribute:: workers
+
+        Ordered dictionary of workers of :class:`Pipeline` objects
+        of the loader, e.g. ``Updater.format_value``, to
+        ``[seconds, calls]`` lists
+
+    ..  attribute:: promises
+
+        List of ``(key, promise)`` pairs of :class:`Promise` objects of
+        the result tree, see :meth:`slowest`
+
+    """
+
+    #: Clock of the profiler, which returns time in seconds
+    timer = staticmethod(timer)
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.files = OrderedDict()
+        self.workers = OrderedDict()
+        self.promises = []
+
+    def clear(self):
+        """ Resets collected timings """
+        self.phases.clear()
+        self.files.clear()
+        self.workers.clear()
+        self.promises = []
+
+    def phase(self, name, elapsed, count=0):
+        """
+        Adds time to the loading phase
+
+        :param str name: Name of the phase
+        :param float elapsed: Time in seconds
+        :param int count: Count of processed objects
+
+        """
+        entry = self.phases.get(name)
+        if entry is None:
+            entry = self.phases[name] = [0.0, 0]
+        entry[0] += elapsed
+        entry[1] += count
+
+    def file(self, path, parse, update, keys):
+        """
+        Adds timings of the source file, and the same timings
+        to ``parse`` and ``update`` phases
+
+        :param str path: Path to source file
+        :param float parse: Time of parsing in seconds
+        :param float update: Time of updating the tree in seconds
+        :param int keys: Count of keys of the file
+
+        """
+        entry = self.files.get(path)
+        if entry is None:
+            entry = self.files[path] = [0.0, 0.0, 0]
+        entry[0] += parse
+        entry[1] += update
+        entry[2] += keys
+        self.phase("parse", parse, 1)
+        self.phase("update", update, keys)
+
+    def instrument(self, pipeline):
+        """
+        Replaces workers of the pipeline by ones that collect
+        their timings into :attr:`workers`.  Objects, which are not
+        instances of :class:`Pipeline`, are left as is.
+
+        :param Pipeline pipeline: Pipeline to instrument
+
+        """
+        if not isinstance(pipeline, Pipeline):
+            return
+        workers = []
+        for worker in pipeline.__pipeline__:
+            profiled = getattr(worker, "__profiled__", None)
+            if profiled is not None:
+                if profiled[0] is self:
+                    workers.append(worker)
+                    continue
+                worker = profiled[1]
+            name = "{0}.{1}".format(pipeline.__class__.__name__, worker.__name__)
+            workers.append(self._wrap(name, worker))
+        pipeline.__pipeline__ = workers
+        # Dispatch table of :class:`Updater` refers to original workers
+        pipeline.__dict__.pop("_dispatch", None)
+
+    def _wrap(self, name, worker):
+        @functools.wraps(worker)
+        def profiled(*args):
+            start = timer()
+            try:
+                return worker(*args)
+            finally:
+                elapsed = timer() - start
+                entry = self.workers.get(name)
+                if entry is None:
+                    entry = self.workers[name] = [0.0, 0]
+                entry[0] += elapsed
+                entry[1] += 1
+
+        profiled.__profiled__ = (self, worker)
+        return profiled
+
+    def watch(self, tree):
+        """
+        Remembers :class:`Promise` objects of the tree before post-processing,
+        so that their evaluation times can be reported by :meth:`slowest`.
+        Promises of :class:`LazyTree` are reported after access to them.
+
+        :param Tree tree: Loaded tree
+
+        """
+        # Access to keys of lazy tree would resolve them
+        pairs = Tree._pairs(tree) if isinstance(tree, Tree) else tree.items()
+        self.promises = [
+            (key, value) for key, value in pairs if isinstance(value, Promise)
+        ]
+
+    def slowest(self, count=10):
+        """
+        Returns list of ``(seconds, key, action)`` tuples of the slowest
+        resolved promises, where ``action`` is :class:`UpdateAction`
+        that has created the promise, or ``None``.  The time includes
+        evaluation of the promise dependencies.
+
+        :param int count: Maximum length of the list
+
+        """
+        resolved = [
+            (promise.elapsed, key, promise.action)
+            for key, promise in self.promises
+            if promise.elapsed is not None
+        ]
+        resolved.sort(key=lambda item: -item[0])
+        return resolved[:count]
+
+    def report(self, count=10):
+        """
+        Returns collected timings as JSON serializable dictionary.
+        Files are sorted by time, and only ``count`` slowest ones
+        are included, as well as promises.
+
+        :param int count: Maximum number of files and promises
+
+        """
+        files = sorted(
+            self.files.items(), key=lambda item: -(item[1][0] + item[1][1])
+        )
+        workers = sorted(self.workers.items(), key=lambda item: -item[1][0])
+        return {
+            "phases": [
+                {"name": name, "seconds": seconds, "count": number}
+                for name, (seconds, number) in self.phases.items()
+            ],
+            "files": [
+                {"path": path, "parse": parse, "update": update, "keys": keys}
+                for path, (parse, update, keys) in files[:count]
+            ],
+            "workers": [
+                {"name": name, "seconds": seconds, "calls": calls}
+                for name, (seconds, calls) in workers
+            ],
+            "promises": [
+                {
+                    "key": key,
+                    "seconds": seconds,
+                    "action": repr(action) if action is not None else None,
+                }
+                for seconds, key, action in self.slowest(count)
+            ],
+        }
+
+    def format(self, count=10):
+        """
+        Returns collected timings as human readable tables,
+        see :meth:`report`
+
+        :param int count: Maximum number of files and promises
+
+        """
+        report = self.report(count)
+        lines = ["%-40s %12s %10s" % ("Phase", "Time, ms", "Count")]
+        for phase in report["phases"]:
+            lines.append(
+                "%-40s %12.3f %10d"
+                % (phase["name"], phase["seconds"] * 1000, phase["count"])
+            )
+        lines.extend(["", "%-40s %12s %10s" % ("Worker", "Time, ms", "Calls")])
+        for worker in report["workers"]:
+            lines.append(
+                "%-40s %12.3f %10d"
+                % (worker["name"], worker["seconds"] * 1000, worker["calls"])
+            )
+        lines.extend(
+            ["", "%-40s %12s %12s %10s" % ("File", "Parse, ms", "Update, ms", "Keys")]
+        )
+        for f in report["files"]:
+            lines.append(
+                "%-40s %12.3f %12.3f %10d"
+                % (f["path"], f["parse"] * 1000, f["update"] * 1000, f["keys"])
+            )
+        lines.extend(["", "%-40s %12s  %s" % ("Promise", "Time, ms", "Expression")])
+        for promise in report["promises"]:
+            lines.append(
+                "%-40s %12.3f  %s"
+                % (promise["key"], promise["seconds"] * 1000, promise["action"] or "")
+            )
+        return "\n".join(lines)
+
+
+class _NullProfiler(object):
+    """
+    Profiler that collects nothing.  :class:`Loader` uses it, when
+    profiling is disabled, so that it makes no checks and no timer calls.
+    Instrumented workers are restored to the original ones.
+
+    """
+
+    @staticmethod
+    def timer():
+        return 0.0
+
+    def clear(self):
+        pass
+
+    def phase(self, name, elapsed, count=0):
+        pass
+
+    def file(self, path, parse, update, keys):
+        pass
+
+    def instrument(self, pipeline):
+        if not isinstance(pipeline, Pipeline):
+            return
+        workers = [
+            getattr(worker, "__profiled__", (None, worker))[1]
+            for worker in pipeline.__pipeline__
+        ]
+        if workers != pipeline.__pipeline__:
+            pipeline.__pipeline__ = workers
+            pipeline.__dict__.pop("_dispatch", None)
+
+    def watch(self, tree):
+        pass
+
+
+_null_profiler = _NullProfiler()
+
+
 ###############################################################################
 # Walker
 ##
@@ -143,6 +1127,17 @@ class Walker(Pipeline):
     """
     File walker is used by :class:`Loader` to get list of files to load.
 
+    ..  attribute:: scanned
+
+        Number of directory entries scanned by the last call
+
+    ..  attribute:: entry_checks
+
+        Number of file type checks of the last call, which have been
+        answered by directory entries of :func:`os.scandir`
+        instead of :func:`os.path.isfile` and :func:`os.path.isdir`.
+        Directory entries usually know their types without stat calls.
+
     ..  attribute:: params
 
         Dictionary that contains all keyword arguments that are passed
@@ -173,6 +1168,8 @@ class Walker(Pipeline):
 
     def __init__(self, **params):
         self.params = params
+        self.scanned = 0
+        self.entry_checks = 0
 
     def __call__(self, path):
         """
@@ -180,17 +1177,27 @@ class Walker(Pipeline):
 
         :param str path: Path to walk over
 
-        """
+        """
+        from . import logger
+
+        self.scanned = 0
+        self.entry_checks = 0
         fileobj = File(os.path.dirname(path), os.path.basename(path), self.params)
         for f in self.walk(fileobj):
             yield f.fullpath
+        logger.info(
+            "Scanned %d entries, %d type checks answered by them",
+            self.scanned,
+            self.entry_checks,
+        )
 
     def walk(self, current):
         """
         Processes current traversing file
 
         If ``current`` is regular file, it will be yielded as is.
-        If it is directory, the list of its files will be prioritized
+        If it is directory, it will be scanned by :func:`os.scandir`,
+        and the list of its files will be prioritized
         using :attr:`__pipeline__`.  Then the list will be sorted using
         given priorities and each file will be processed using this method
         recursively.
@@ -205,13 +1212,18 @@ class Walker(Pipeline):
             yield current
         elif current.isdir:
             files = []
-            for name in os.listdir(current.fullpath):
-                fileobj = File(current.fullpath, name, current.params)
+            for entry in scandir(current.fullpath):
+                fileobj = File(current.fullpath, entry.name, current.params, entry)
                 priority = None
                 for modifier in self.__pipeline__:
                     priority = modifier(fileobj)
                     if priority is not None:
                         break
+                # Each file type check has been answered by directory entry
+                self.scanned += 1
+                self.entry_checks += (fileobj._isfile is not None) + (
+                    fileobj._isdir is not None
+                )
                 if priority < 0:
                     continue
                 files.append((priority, fileobj))
@@ -352,7 +1364,8 @@ class File(object):
 
         The copy of :attr:`Walker.params` that could be used and transformed
         by workers from :attr:`Walker.__pipeline__`.
-        See :meth:`Walker.environment`.
+        See :meth:`Walker.environment`.  It is :class:`CopyOnWriteDict`,
+        i.e. the params are copied only if a worker changes them.
 
     ..  attribute:: fullpath
 
@@ -374,42 +1387,139 @@ class File(object):
 
         Name of the file without its extension
 
+    ..  attribute:: entry
+
+        :class:`os.DirEntry` object of the file, if it is available.
+        It is used to check file type without extra stat calls.
+
     """
 
-    def __init__(self, path, name, params):
+    __slots__ = ("path", "name", "params", "entry", "_fullpath", "_isfile", "_isdir")
+
+    def __init__(self, path, name, params, entry=None):
         self.path = path
         self.name = name
-        self.params = params.copy()
+        self.params = CopyOnWriteDict(params)
+        self.entry = entry
+        self._fullpath = None
+        self._isfile = None
+        self._isdir = None
 
     def __lt__(self, other):
         return self.name < other.name
 
-    @cached_property
+    @property
     def fullpath(self):
-        return os.path.join(self.path, self.name)
+        if self._fullpath is None:
+            self._fullpath = os.path.join(self.path, self.name)
+        return self._fullpath
 
-    @cached_property
+    @property
     def isfile(self):
-        return os.path.isfile(self.fullpath)
+        if self._isfile is None:
+            if self.entry is not None:
+                self._isfile = self.entry.is_file()
+            else:
+                self._isfile = os.path.isfile(self.fullpath)
+        return self._isfile
 
-    @cached_property
+    @property
     def isdir(self):
-        return os.path.isdir(self.fullpath)
+        if self._isdir is None:
+            if self.entry is not None:
+                self._isdir = self.entry.is_dir()
+            else:
+                self._isdir = os.path.isdir(self.fullpath)
+        return self._isdir
 
-    @cached_property
+    @property
     def ext(self):
         return os.path.splitext(self.name)[1]
 
-    @cached_property
+    @property
     def cleanname(self):
         return os.path.splitext(self.name)[0]
 
 
+class CopyOnWriteDict(MutableMapping):
+    """
+    Dictionary that shares passed ``data`` until it is changed.
+    On the first change the data is copied, so that the passed
+    dictionary itself is never changed.
+
+    ..  code-block:: pycon
+
+        >>> data = {'env': 'foo.bar'}
+        >>> params = CopyOnWriteDict(data)
+        >>> params['env'] = 'bar'
+        >>> params['env'], data['env']
+        ('bar', 'foo.bar')
+
+    :param dict data: Data to share
+
+    """
+
+    __slots__ = ("_data", "_owned")
+
+    def __init__(self, data):
+        if isinstance(data, CopyOnWriteDict):
+            data = data._data
+        self._data = data
+        self._owned = False
+
+    def _own(self):
+        if not self._owned:
+            self._data = dict(self._data)
+            self._owned = True
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._own()
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        self._own()
+        del self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return "{0}({1!r})".format(self.__class__.__name__, self._data)
+
+    def copy(self):
+        """ Returns a copy of the data as :class:`dict` """
+        return dict(self._data)
+
+
 ###############################################################################
 # Updater
 ##
 
 
+def trigger(key="", value=()):
+    """
+    Decorator that declares which keys and values :class:`Updater` worker
+    handles.  The worker is called only if any of the ``key`` chars is found
+    in the key, or string value starts with any of the ``value`` prefixes.
+
+    :param str key: Chars of keys that trigger the worker
+    :param list value: Prefixes of values that trigger the worker
+
+    """
+
+    def decorator(f):
+        f.__trigger__ = (key, tuple(value))
+        return f
+
+    return decorator
+
+
 class Updater(Pipeline):
     """
     Updater is used by :class:`Loader` to set up key-value pairs into
@@ -422,8 +1532,19 @@ class Updater(Pipeline):
         into constructor.  The attribute can be used by workers.
 
         Only the ``namespace`` parameter makes sense for :meth:`eval_value`
-        worker.  All other parameters are simply ignored, but could be used
-        in extensions.
+        worker, and the ``cache_size`` one sets up size of :attr:`code_cache`
+        and :attr:`template_cache` (``1024`` by default).  All other
+        parameters are simply ignored, but could be used in extensions.
+
+    ..  attribute:: code_cache
+
+        :class:`ExpressionCache` of code objects compiled from expressions
+        of :meth:`eval_value`.
+
+    ..  attribute:: template_cache
+
+        :class:`ExpressionCache` of formatting functions prepared from
+        templates of :meth:`format_value` and :meth:`printf_value`.
 
     ..  attribute:: __pipeline__
 
@@ -437,19 +1558,61 @@ class Updater(Pipeline):
 
         The list of workers is:
         [:meth:`set_default`, :meth:`call_method`, :meth:`format_value`,
-        :meth:`printf_value`, :meth:`eval_value`, :meth:`required_value`]
+        :meth:`printf_value`, :meth:`eval_value`, :meth:`required_value`,
+        :meth:`add_method`, :meth:`not_method`]
+
+        Each worker declares keys and values it handles by :func:`trigger`
+        decorator.  So that only relevant workers are called for each key,
+        and plain keys and values are set up into tree directly.  If any
+        worker of the pipeline has no triggers, each key is passed through
+        the whole pipeline.
 
     """
 
     def __init__(self, **params):
         self.params = params
 
+    @cached_property
+    def _dispatch(self):
+        # Key chars pattern, value prefixes, and cache of worker lists
+        # by triggers; or ``None`` if whole pipeline should be used
+        key_chars = []
+        value_prefixes = []
+        for worker in self.__pipeline__:
+            triggers = getattr(worker, "__trigger__", None)
+            if triggers is None:
+                return None
+            key_chars.extend(c for c in triggers[0] if c not in key_chars)
+            value_prefixes.extend(p for p in triggers[1] if p not in value_prefixes)
+        if key_chars:
+            key_chars = re.compile("[%s]" % re.escape("".join(key_chars)))
+        else:
+            key_chars = None
+        return key_chars, tuple(value_prefixes), {}
+
+    @cached_property
+    def code_cache(self):
+        return ExpressionCache(
+            lambda expression: compile(expression, "<string>", "eval"),
+            self.params.get("cache_size", 1024),
+        )
+
+    @cached_property
+    def template_cache(self):
+        def prepare(template):
+            kind, template = template[:3], template[4:]
+            return template.format if kind == "$>>" else template.__mod__
+
+        return ExpressionCache(prepare, self.params.get("cache_size", 1024))
+
     def __call__(self, tree, key, value, source):
         """
         Updates tree
 
         It creates :class:`UpdateAction` object.  Then pass the object through
-        the :attr:`__pipeline__`.  And finally calls the action.
+        workers of the :attr:`__pipeline__` triggered by the key and value.
+        And finally calls the action.  If no worker is triggered,
+        the value is set up into the tree directly.
 
         :param Tree tree: Updating tree object
         :param str key: Setting up key
@@ -457,12 +1620,42 @@ class Updater(Pipeline):
         :param str source: Full path to a source file
 
         """
+        dispatch = self._dispatch
+        if dispatch is None:
+            workers = self.__pipeline__
+        else:
+            key_chars, value_prefixes, table = dispatch
+            chars = key_chars.findall(key) if key_chars is not None else ()
+            if isinstance(value, basestr) and value.startswith(value_prefixes):
+                prefixes = tuple(p for p in value_prefixes if value.startswith(p))
+            elif not chars:
+                tree[key] = value
+                return
+            else:
+                prefixes = ()
+            triggers = (frozenset(chars), prefixes)
+            workers = table.get(triggers)
+            if workers is None:
+                workers = table[triggers] = [
+                    worker
+                    for worker in self.__pipeline__
+                    if triggers[0].intersection(worker.__trigger__[0])
+                    or set(prefixes).intersection(worker.__trigger__[1])
+                ]
         action = UpdateAction(tree, key, value, source)
-        for modifier in self.__pipeline__:
-            modifier(action)
-        action()
+        # Promises resolved by workers see the tree, which is not loaded
+        # completely yet, so their results must not be cached
+        loading = getattr(_tracking, "loading", False)
+        _tracking.loading = True
+        try:
+            for modifier in workers:
+                modifier(action)
+            action()
+        finally:
+            _tracking.loading = loading
 
     @Pipeline.worker(20)
+    @trigger(key="?")
     def set_default(self, action):
         """
         Worker that changes default :attr:`UpdateAction.update` from
@@ -494,6 +1687,7 @@ class Updater(Pipeline):
         action.update = update
 
     @Pipeline.worker(30)
+    @trigger(key="#")
     def call_method(self, action):
         """
         Worker that changes default :attr:`UpdateAction.update` if key contains
@@ -501,12 +1695,17 @@ class Updater(Pipeline):
 
         It splits :attr:`UpdateAction.key` by the char.  The left part is set
         up as the key itself.  The right part is used as a method name.
-        It gets value from :attr:`UpdateAction.tree` by the new key and call
+        It gets value from :attr:`UpdateAction.tree` by the new key, calls
         its method using :attr:`UpdateAction.value` as an argument.
-        If any of the values is instance of :class:`Promise`, then it will be
-        wrapped by another :class:`Promise` object.
+        If any of the values is instance of :class:`Promise`, then it will
+        be wrapped by another :class:`Promise` object.
         See :meth:`PostProcessor.resolve_promise`.
 
+        The method changes the value in place, except values taken from
+        base tree of :class:`configtree.tree.LayeredTree`.  They are shared
+        with other trees, so the method is called on a shallow copy,
+        which is set up back.  Branches are always changed in place.
+
         :param UpdateAction action: Current update action object
 
         ..  attribute:: __priority__ = 30
@@ -530,20 +1729,28 @@ class Updater(Pipeline):
                 old_value = action.tree[action.key]
             else:
                 return
+            shared = _shared(action.tree, action.key)
             if isinstance(old_value, Promise) or isinstance(action.value, Promise):
 
                 def deferred():
                     new_value = Promise.resolve(old_value)
+                    if shared and not isinstance(new_value, ITree):
+                        new_value = copy.copy(new_value)
                     getattr(new_value, method)(Promise.resolve(action.value))
                     return new_value
 
                 action.tree[action.key] = action.promise(deferred)
+            elif shared and not isinstance(old_value, ITree):
+                new_value = copy.copy(old_value)
+                getattr(new_value, method)(action.value)
+                action.tree[action.key] = new_value
             else:
                 getattr(old_value, method)(action.value)
 
         action.update = update
 
     @Pipeline.worker(120)
+    @trigger(key="+")
     def add_method(self, action):
         """
         Worker that add :attr:`UpdateAction.value` if key contains
@@ -618,6 +1825,7 @@ class Updater(Pipeline):
         action.update = update
 
     @Pipeline.worker(140)
+    @trigger(key="!")
     def not_method(self, action):
         """
         Worker that add :attr:`UpdateAction.value` if key contains
@@ -655,6 +1863,7 @@ class Updater(Pipeline):
         )
 
     @Pipeline.worker(50)
+    @trigger(value=["$>> "])
     def format_value(self, action):
         """
         Worker that transforms :attr:`UpdateAction.value` that starts
@@ -662,9 +1871,9 @@ class Updater(Pipeline):
         and wraps it into :class:`Promise`.
         See :meth:`PostProcessor.resolve_promise`.
 
-        The expression uses :meth:`str.format`.  Current tree and current
-        branch are passed as ``self`` and ``branch`` names into template.
-        Both are wrapped by :class:`ResolverProxy`.
+        The expression uses :meth:`str.format`, see :attr:`template_cache`.
+        Current tree and current branch are passed as ``self`` and ``branch``
+        names into template.  Both are wrapped by :class:`ResolverProxy`.
 
         :param UpdateAction action: Current update action object
 
@@ -683,15 +1892,16 @@ class Updater(Pipeline):
         """
         if not isinstance(action.value, basestr) or not action.value.startswith("$>> "):
             return
-        value = action.value[4:]
+        template = self.template_cache(action.value)
         action.value = action.promise(
-            lambda: value.format(
+            lambda: template(
                 self=ResolverProxy(action.tree, action.source),
                 branch=ResolverProxy(action.branch),
             )
         )
 
     @Pipeline.worker(60)
+    @trigger(value=["%>> "])
     def printf_value(self, action):
         """
         Worker that transform :attr:`UpdateAction.value` that starts
@@ -717,19 +1927,21 @@ class Updater(Pipeline):
         """
         if not isinstance(action.value, basestr) or not action.value.startswith("%>> "):
             return
-        value = action.value[4:]
+        template = self.template_cache(action.value)
         action.value = action.promise(
-            lambda: value % ResolverProxy(action.tree, action.source)
+            lambda: template(ResolverProxy(action.tree, action.source))
         )
 
     @Pipeline.worker(70)
+    @trigger(value=[">>> "])
     def eval_value(self, action):
         """
         Worker that transform :attr:`UpdateAction.value` that starts with
         ``">>> "`` (with trailing space char) into expression and wraps it
         into :class:`Promise`.  See :meth:`PostProcessor.resolve_promise`.
 
-        The expression uses built-in function :func:`eval`.
+        The expression uses built-in function :func:`eval`.  It is compiled
+        only once per distinct source, see :attr:`code_cache`.
         The value of ``namespace`` key from :attr:`params` is passed as
         ``gloabls`` argument of ``eval``.  :attr:`UpdateAction.tree` is passed
         as ``self`` and `UpdateAction.branch` is passed as ``branch`` names
@@ -762,7 +1974,7 @@ class Updater(Pipeline):
         namespace = self.params.get("namespace", {})
         action.value = action.promise(
             lambda: eval(
-                value,
+                self.code_cache(value),
                 namespace,
                 {
                     "self": ResolverProxy(action.tree, action.source),
@@ -772,6 +1984,7 @@ class Updater(Pipeline):
         )
 
     @Pipeline.worker(80)
+    @trigger(value=["!!!"])
     def required_value(self, action):
         """
         Worker that transform :attr:`UpdateAction.value` that starts with
@@ -841,6 +2054,8 @@ class UpdateAction(object):
 
     """
 
+    __slots__ = ("tree", "key", "value", "update", "source", "_key", "_value")
+
     def __init__(self, tree, key, value, source):
         self.tree = tree
         self.key = key
@@ -859,6 +2074,42 @@ class UpdateAction(object):
         key = self.key.rsplit(self.tree._key_sep, 1)[0]
         return self.tree.branch(key)
 
+    @property
+    def references(self):
+        """
+        List of keys, which expression of the original value refers to,
+        i.e. ``self[...]`` and ``branch[...]`` items of ``>>>`` and ``$>>``
+        expressions, and ``%(...)s`` items of ``%>>`` ones.
+        It is ``None``, if the value is not an expression or its references
+        cannot be found without evaluation.
+
+        ..  code-block:: pycon
+
+            >>> tree = Tree()
+            >>> UpdateAction(tree, 'a.b', ">>> self['x'] + branch['y']", '').references
+            ['x', 'a.y']
+
+        """
+        value = self._value
+        if not isinstance(value, basestr):
+            return None
+        kind, expression = value[:4], value[4:]
+        if kind == ">>> ":
+            references = _eval_references(expression)
+        elif kind == "$>> ":
+            references = _format_references(expression)
+        elif kind == "%>> ":
+            references = _printf_references(expression)
+        else:
+            return None
+        if references is None:
+            return None
+        sep = self.tree._key_sep
+        branch = self.key.rsplit(sep, 1)[0] + sep if sep in self.key else ""
+        return [
+            key if name == "self" else branch + key for name, key in references
+        ]
+
     def __call__(self):
         """ Calls :attr:`update`, i.e. performs update action """
         self.update(self)
@@ -868,24 +2119,17 @@ class UpdateAction(object):
 
     def promise(self, deferred):
         """
-        Helper method that wraps ``deferred`` callable by try-except block.
-        It adds ``self`` as a first argument to any exception that might
-        be raised from ``deferred``.  So that the exception will contain
-        information of what expression from which file is caused it.
+        Helper method that wraps ``deferred`` callable by :class:`Promise`
+        bound to ``self``.  The promise adds ``self`` as a last argument
+        to any exception that might be raised from ``deferred``.  So that
+        the exception will contain information of what expression from which
+        file is caused it.
 
         :param callable deferred: Callable object that should be wrapped by
                                   :class:`Promise`
 
         """
-
-        def wrapper():
-            try:
-                return deferred()
-            except Exception as e:
-                args = e.args + (self,)
-                raise e.__class__(*args)
-
-        return Promise(wrapper)
+        return Promise(deferred, self)
 
     @staticmethod
     def default_update(action):
@@ -902,6 +2146,69 @@ class UpdateAction(object):
         action.tree[action.key] = action.value
 
 
+def _eval_references(expression):
+    """
+    Returns list of ``(name, key)`` pairs of constant items of ``self``
+    and ``branch`` names within Python expression, or ``None`` if the names
+    are used in other way
+
+    """
+    try:
+        parsed = ast.parse(expression, mode="eval")
+    except SyntaxError:
+        return None
+    references = []
+    names = 0
+    for node in ast.walk(parsed):
+        if isinstance(node, ast.Name) and node.id in ("self", "branch"):
+            names += 1
+        if not isinstance(node, ast.Subscript):
+            continue
+        if not isinstance(node.value, ast.Name):
+            continue
+        if node.value.id not in ("self", "branch"):
+            continue
+        key = node.slice
+        if isinstance(key, getattr(ast, "Index", ())):  # pragma: no cover
+            key = key.value
+        key = getattr(key, "value", getattr(key, "s", None))
+        if isinstance(key, basestr):
+            references.append((node.value.id, key))
+    if len(references) != names:
+        return None
+    return references
+
+
+def _format_references(template):
+    """
+    Returns list of ``(name, key)`` pairs of ``self`` and ``branch`` items
+    within :meth:`str.format` template, or ``None`` if there are other fields
+
+    """
+    references = []
+    try:
+        fields = list(string.Formatter().parse(template))
+    except ValueError:
+        return None
+    for _, field, spec, _ in fields:
+        if field is None:
+            continue
+        match = _format_field.match(field)
+        if match is None or "{" in (spec or ""):
+            return None
+        references.append(match.groups())
+    return references
+
+
+def _printf_references(template):
+    """ Returns list of ``("self", key)`` pairs of printf style template """
+    return [("self", key) for key in _printf_field.findall(template)]
+
+
+_format_field = re.compile(r"^(self|branch)\[([^\]]+)\]")
+_printf_field = re.compile(r"%\(([^)]*)\)")
+
+
 class Promise(object):
     """
     Represents deferred expression that should be calculated at the end
@@ -909,16 +2216,166 @@ class Promise(object):
     :meth:`Updater.format_value`, :meth:`Updater.printf_value`, and
     :meth:`PostProcessor.resolve_promise`.
 
+    The deferred expression is called only once, its result is cached
+    and returned on subsequent calls.  So that a promise referenced by many
+    other ones is not re-evaluated on each access.  Results of promises
+    resolved by :class:`Updater` workers, e.g. :meth:`Updater.add_method`,
+    are not cached, because the tree is not loaded completely at that time.
+    If the expression refers to itself, directly or through other promises,
+    :class:`CircularReferenceError` is raised.
+
+    Promise can be resolved from many threads, see :class:`PostProcessor`.
+    The expression is evaluated by one thread, and the others wait for
+    its result.  Reference cycles spanning threads are detected too.
+    The lock is held by the promise only until its result is cached.
+
     :param callable deferred: Deferred expression
+    :param UpdateAction action: Action that creates the promise,
+                                see :meth:`UpdateAction.promise`
+
+    ..  attribute:: action
+
+        :class:`UpdateAction` object that has created the promise.
+        If it is not ``None``, it is appended to arguments of any exception
+        raised from the deferred expression.
+
+    ..  attribute:: dependencies
+
+        List of keys, which have been read by the expression through
+        :class:`ResolverProxy`, or ``None`` if the promise is not resolved yet.
+        Dependencies of promises resolved by :meth:`resolve` within
+        the expression are included too.
+
+    ..  attribute:: elapsed
+
+        Time of the expression evaluation in seconds, including evaluation
+        of its dependencies, or ``None`` if the promise is not resolved yet
 
     """
 
-    def __init__(self, deferred):
+    __slots__ = (
+        "deferred",
+        "action",
+        "dependencies",
+        "elapsed",
+        "_result",
+        "_resolving",
+        "_lock",
+        "_owner",
+    )
+
+    def __init__(self, deferred, action=None):
         self.deferred = deferred
+        self.action = action
+        self.dependencies = None
+        self.elapsed = None
+        self._result = _void
+        self._resolving = False
+        # Lock is created on demand and dropped, when result is cached,
+        # see :meth:`_acquire`
+        self._lock = None
+        self._owner = None
 
     def __call__(self):
-        """ Resolves deferred value, i.e. calls it and returns its result """
-        return self.deferred()
+        """
+        Resolves deferred value, i.e. calls it and returns its result
+
+        ..  code-block:: pycon
+
+            >>> calls = []
+            >>> p = Promise(lambda: calls.append(1) or len(calls))
+            >>> p(), p()
+            (1, 1)
+
+        """
+        if self._result is not _void:
+            return self._result
+        lock = self._acquire()
+        if lock is None:
+            # Has been resolved by another thread
+            return self._result
+        try:
+            if self._result is not _void:
+                # Has been resolved by another thread
+                return self._result
+            if self._resolving:
+                raise CircularReferenceError("Circular reference detected")
+            self._resolving = True
+            self._owner = threading.current_thread()
+            stack = _tracking_stack()
+            stack.append([])
+            start = timer()
+            try:
+                result = self.deferred()
+            except Exception as e:
+                if self.action is None:
+                    raise
+                raise e.__class__(*(e.args + (self.action,)))
+            finally:
+                self._resolving = False
+                self._owner = None
+                self.elapsed = timer() - start
+                self.dependencies = stack.pop()
+            if not getattr(_tracking, "loading", False):
+                self._result = result
+                # Threads that wait for the lock already have it,
+                # and others get the result without locking
+                self._lock = None
+            return result
+        finally:
+            lock.release()
+
+    def _acquire(self):
+        """
+        Acquires lock of the promise, creating it if necessary.  If the promise
+        is being resolved by another thread, which directly or through other
+        promises waits for the current one, :class:`CircularReferenceError`
+        is raised instead of deadlock.
+
+        :returns: Acquired lock, or ``None`` if the promise has been resolved
+
+        """
+        lock = self._lock
+        if lock is None:
+            with _waiting_lock:
+                if self._result is not _void:
+                    return None
+                if self._lock is None:
+                    self._lock = threading.RLock()
+                lock = self._lock
+        if lock.acquire(False):
+            return lock
+        current = threading.current_thread()
+        with _waiting_lock:
+            promise = self
+            while promise is not None:
+                if promise._owner is current:
+                    raise CircularReferenceError("Circular reference detected")
+                promise = _waiting.get(promise._owner)
+            _waiting[current] = self
+        try:
+            lock.acquire()
+        finally:
+            with _waiting_lock:
+                del _waiting[current]
+        return lock
+
+    @staticmethod
+    def depend(keys):
+        """
+        Records ``keys`` as dependencies of the promise, which is being
+        evaluated in the current thread.  Does nothing out of evaluation.
+
+        :param list keys: Keys to record
+
+        """
+        stack = _tracking_stack()
+        if not stack:
+            return
+        dependencies = stack[-1]
+        for key in keys:
+            if key not in dependencies:
+                dependencies.append(key)
 
     @staticmethod
     def resolve(value):
@@ -926,6 +2383,9 @@ class Promise(object):
         Helper method that resolves passed promises and returns their results.
         Other values are returned as is.
 
+        Dependencies of the resolved promise are recorded as dependencies
+        of the promise being evaluated, see :meth:`depend`.
+
         :param value: Value to resolve
         :returns: Resolved promise or value as it is.
 
@@ -938,10 +2398,32 @@ class Promise(object):
 
         """
         if isinstance(value, Promise):
-            return value()
+            result = value()
+            Promise.depend(value.dependencies)
+            return result
         return value
 
 
+_tracking = threading.local()
+
+# Promises which threads are waiting for, see :meth:`Promise._acquire`
+_waiting = {}
+_waiting_lock = threading.Lock()
+
+
+def _tracking_stack():
+    """
+    Returns stack of dependency lists of promises, which are being evaluated
+    in the current thread
+
+    """
+    try:
+        return _tracking.stack
+    except AttributeError:
+        _tracking.stack = []
+        return _tracking.stack
+
+
 class ResolverProxy(object):
     """
     Helper object that wraps :class:`configtree.tree.Tree` objects.
@@ -952,6 +2434,9 @@ class ResolverProxy(object):
     If ``source`` argument is not ``None``, there will be ``__file__`` and
     ``__dir__`` keys available.
 
+    Each extracted key is recorded as a dependency of the promise,
+    which is being evaluated, see :meth:`Promise.depend`.
+
     :param Tree tree: Tree object to wrap
     :param str source: Path to source file
 
@@ -978,7 +2463,7 @@ class ResolverProxy(object):
 
     def __getitem__(self, key):
         try:
-            return Promise.resolve(self.__tree[key])
+            value = self.__tree[key]
         except KeyError:
             if self.__source is not None:
                 if key == "__file__":
@@ -986,6 +2471,12 @@ class ResolverProxy(object):
                 elif key == "__dir__":
                     return os.path.dirname(self.__source)
             raise
+        if isinstance(self.__tree, BranchProxy):
+            key = self.__tree._itemkey(key)
+        Promise.depend([key])
+        if isinstance(value, Promise):
+            value = value()
+        return value
 
     def __getattr__(self, attr):
         return getattr(self.__tree, attr)
@@ -1000,6 +2491,8 @@ class Required(object):
 
     """
 
+    __slots__ = ("key", "comment")
+
     def __init__(self, key, comment=""):
         self.key = key
         self.comment = comment
@@ -1032,31 +2525,163 @@ class PostProcessor(Pipeline):
         The list of workers is:
         [:meth:`resolve_promise`, :meth:`check_required`]
 
+    ..  attribute:: graph
+
+        :class:`DependencyGraph` of promises resolved by the last call.
+        See :meth:`resolve_promise`.
+
+    ..  attribute:: threads
+
+        Number of threads to resolve promises in parallel,
+        see :meth:`resolve_components`.  By default promises are resolved
+        one by one.
+
     """
 
+    def __init__(self, threads=None):
+        self.threads = threads
+        # Exceptions raised by promises on the thread pool,
+        # see :meth:`resolve_components`
+        self._failures = {}
+
+    @cached_property
+    def graph(self):
+        return DependencyGraph()
+
     def __call__(self, tree):
         """
         Runs post processor
 
+        If ``tree`` is :class:`LazyTree`, processing is deferred,
+        so that each key is processed on first access.
+
+        Keys are processed in topological order of :attr:`graph`
+        recorded by previous call, if any.  So that on reload dependencies
+        are resolved before their dependants, instead of nested evaluation.
+
         :param Tree tree: A tree object to process
 
         """
+        if isinstance(tree, LazyTree):
+            self.graph.clear()
+            tree.defer(self)
+            return
+        keys = self.graph.order(tree.keys())
+        if self.threads is not None and self.threads > 1:
+            self._failures = self.resolve_components(tree, keys)
+        self.graph.clear()
         errors = []
-        for key, value in tree.items():
-            for modifier in self.__pipeline__:
-                error = modifier(tree, key, value)
-                if error is not None:
-                    errors.append(error)
+        try:
+            for key in keys:
+                errors.extend(self.process(tree, key, tree[key]))
+        finally:
+            self._failures = {}
         if errors:
             errors.sort(key=lambda e: str(e))
             raise ProcessingError(*errors)
 
+    def resolve_components(self, tree, keys):
+        """
+        Resolves promises of the tree on a thread pool of :attr:`threads`
+
+        Promises are split into independent components using references
+        found by :attr:`UpdateAction.references`, and dependencies recorded
+        into :attr:`graph` by the previous call.  Each component is resolved
+        by a single thread.  If a promise refers to one of another component,
+        it waits for the result, so that the references are just a hint.
+
+        A thread stops resolving its component on the first error.
+        The exception is returned, and :meth:`resolve_promise` raises it
+        instead of evaluating the failed promise again, so that errors
+        are reported exactly as in sequential mode.
+
+        :param Tree tree: Current processing tree
+        :param list keys: Keys of the tree in order to process
+        :returns: Dictionary of failed promises to their exceptions
+
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        promises = OrderedDict()
+        for key in keys:
+            value = tree[key]
+            if isinstance(value, Promise):
+                promises[key] = value
+
+        # Union-find over keys of promises
+        parents = dict((key, key) for key in promises)
+
+        def find(key):
+            while parents[key] != key:
+                parents[key] = parents[parents[key]]
+                key = parents[key]
+            return key
+
+        for key, promise in promises.items():
+            references = list(self.graph.dependencies.get(key, ()))
+            if promise.action is not None:
+                references.extend(promise.action.references or ())
+            for reference in references:
+                if reference in promises:
+                    targets = [reference]
+                elif reference in tree and isinstance(tree[reference], ITree):
+                    sep = tree._key_sep
+                    targets = [reference + sep + tail for tail in tree[reference]]
+                else:
+                    continue
+                for target in targets:
+                    if target in promises:
+                        parents[find(target)] = find(key)
+
+        components = OrderedDict()
+        for key, promise in promises.items():
+            components.setdefault(find(key), []).append(promise)
+
+        failures = {}
+
+        def resolve(component):
+            for promise in component:
+                try:
+                    promise()
+                except Exception as e:
+                    failures[promise] = e
+                    return
+
+        with ThreadPoolExecutor(self.threads) as executor:
+            for _ in executor.map(resolve, components.values()):
+                pass
+        return failures
+
+    def process(self, tree, key, value):
+        """
+        Passes single key and value through :attr:`__pipeline__`
+
+        :param Tree tree: Current processing tree
+        :param str key: Current processing key
+        :param value: Current processing value
+        :returns: List of errors
+
+        """
+        errors = []
+        for modifier in self.__pipeline__:
+            error = modifier(tree, key, value)
+            if error is not None:
+                errors.append(error)
+        return errors
+
     @Pipeline.worker(30)
     def resolve_promise(self, tree, key, value):
         """
         Worker that resolves :class:`Promise` objects.
 
         Any exception raised within promise expression will not be caught.
+        Since promises cache their results, each one is evaluated only once,
+        even if it is referenced by many other promises.  If the promise
+        has failed on the thread pool, see :meth:`resolve_components`,
+        its exception is raised without evaluation.
+
+        Keys read by the promise and time of its evaluation are recorded
+        into :attr:`graph`.
 
         :param Tree tree: Current processing tree
         :param str key: Current traversing key
@@ -1066,7 +2691,15 @@ class PostProcessor(Pipeline):
 
         """
         if isinstance(value, Promise):
-            tree[key] = value()
+            try:
+                error = self._failures.pop(value, None)
+                if error is not None:
+                    # Has been raised on the thread pool
+                    raise error
+                tree[key] = value()
+            finally:
+                if value.dependencies is not None:
+                    self.graph.add(key, value.dependencies, value.elapsed)
 
     @Pipeline.worker(50)
     def check_required(self, tree, key, value):
@@ -1087,5 +2720,247 @@ class PostProcessor(Pipeline):
             return value
 
 
+class DependencyGraph(object):
+    """
+    Graph of dependencies between keys of a tree, which is recorded
+    by :class:`PostProcessor` during resolution of :class:`Promise` objects
+
+    ..  code-block:: pycon
+
+        >>> graph = DependencyGraph()
+        >>> graph.add('c', ['a', 'b'], 0.002)
+        >>> graph.add('b', ['a'], 0.001)
+        >>> graph.order(['a', 'b', 'c'])
+        ['a', 'b', 'c']
+        >>> list(graph.walk('c'))
+        [(0, 'c'), (1, 'a'), (1, 'b')]
+
+    ..  attribute:: dependencies
+
+        Ordered dictionary of resolved keys to lists of keys they depend on
+
+    ..  attribute:: timings
+
+        Dictionary of resolved keys to times of their evaluation in seconds
+
+    """
+
+    def __init__(self):
+        self.dependencies = OrderedDict()
+        self.timings = {}
+
+    def __contains__(self, key):
+        return key in self.dependencies
+
+    def __len__(self):
+        return len(self.dependencies)
+
+    def add(self, key, dependencies, timing=None):
+        """
+        Adds resolved key into the graph
+
+        :param str key: Resolved key
+        :param list dependencies: Keys the resolved key depends on
+        :param float timing: Time of evaluation in seconds
+
+        """
+        self.dependencies[key] = list(dependencies)
+        self.timings[key] = timing
+
+    def clear(self):
+        """ Removes all keys from the graph """
+        self.dependencies.clear()
+        self.timings.clear()
+
+    def order(self, keys):
+        """
+        Returns list of passed keys in topological order, i.e. each key
+        follows the keys it depends on.  Independent keys keep their
+        original order.
+
+        :param iterable keys: Keys to sort
+
+        """
+        keys = list(keys)
+        if not self.dependencies:
+            return keys
+        included = set(keys)
+        result = []
+        visited = set()
+        for key in keys:
+            # Depth-first search with explicit stack of dependency iterators
+            if key in visited:
+                continue
+            visited.add(key)
+            stack = [(key, iter(self.dependencies.get(key, ())))]
+            while stack:
+                current, dependencies = stack[-1]
+                for dependency in dependencies:
+                    if dependency not in visited:
+                        visited.add(dependency)
+                        stack.append(
+                            (dependency, iter(self.dependencies.get(dependency, ())))
+                        )
+                        break
+                else:
+                    stack.pop()
+                    if current in included:
+                        result.append(current)
+        return result
+
+    def walk(self, key):
+        """
+        Yields ``(level, key)`` pairs of the passed key and its dependencies
+        in depth-first order.  Each key is yielded once, so dependencies
+        of already yielded key are not repeated.
+
+        :param str key: Key to start from
+
+        """
+        visited = set([key])
+        stack = [iter([key])]
+        while stack:
+            for current in stack[-1]:
+                yield len(stack) - 1, current
+                dependencies = [
+                    dependency
+                    for dependency in self.dependencies.get(current, ())
+                    if dependency not in visited
+                ]
+                visited.update(dependencies)
+                stack.append(iter(dependencies))
+                break
+            else:
+                stack.pop()
+
+
+class LazyTree(Tree):
+    """
+    Tree that defers post processing until its keys are accessed
+
+    Use it as :class:`Loader` tree to get configuration without evaluating
+    expressions, which are not used.  When :class:`PostProcessor` is called
+    on the tree, it does nothing but remembers itself.  Then each key is
+    processed on its first access, i.e. :class:`Promise` is resolved and
+    :class:`Required` value raises :class:`ProcessingError`.
+
+    ..  code-block:: pycon
+
+        >>> tree = LazyTree({'a': Promise(lambda: 1), 'b': Required('b')})
+        >>> PostProcessor()(tree)
+        >>> tree['a']
+        1
+        >>> tree['b']
+        Traceback (most recent call last):
+        ...
+        configtree.loader.ProcessingError: Undefined required key <b>
+
+    """
+
+    def __init__(self, data=None):
+        self._postprocess = None
+        self._processed = set()
+        Tree.__init__(self, data)
+
+    def defer(self, postprocess):
+        """
+        Defers post processing of the tree
+
+        :param PostProcessor postprocess: Post processor to use
+                                          on access to keys
+
+        """
+        self._postprocess = postprocess
+        self._processed = set()
+
+    def resolve(self, key=None):
+        """
+        Processes all keys of the tree or its branch at once.  Unlike
+        access to the keys one by one, errors are accumulated and raised
+        within single :class:`ProcessingError`.
+
+        :param str key: Key of branch or value to process
+
+        """
+        if key is None:
+            keys = list(self._items)
+        elif key in self._items:
+            keys = [key]
+        else:
+            keys = [self._key_sep.join((key, tail)) for tail in self.branch(key)]
+        errors = []
+        for key in keys:
+            errors.extend(self._process(key))
+        if errors:
+            errors.sort(key=lambda e: str(e))
+            raise ProcessingError(*errors)
+
+    def _process(self, key):
+        if self._postprocess is None or key in self._processed:
+            return []
+        errors = self._postprocess.process(self, key, self._items[key])
+        if not errors:
+            self._processed.add(key)
+        return errors
+
+    def _pairs(self):
+        return ((key, self[key]) for key in list(self._items))
+
+    def __getitem__(self, key):
+        if key in self._items:
+            errors = self._process(key)
+            if errors:
+                raise ProcessingError(*errors)
+        return Tree.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return key in self._items or self._node(key) is not None
+
+    def __setitem__(self, key, value):
+        Tree.__setitem__(self, key, value)
+        # New value should be processed on access too
+        self._processed.discard(key)
+
+    def __delitem__(self, key):
+        if self._processed and key not in self._items:
+            node = self._node(key)
+            if node is not None:
+                self._processed.difference_update(
+                    [leaf.key for leaf in node.iterleaves()]
+                )
+        Tree.__delitem__(self, key)
+        self._processed.discard(key)
+
+    def _update(self, pairs):
+        if not self._processed:
+            Tree._update(self, pairs)
+            return
+        for key, value in pairs:
+            self[key] = value
+
+    def copy(self):
+        """
+        Returns a shallow copy of the tree.  Unlike iteration over the tree,
+        keys are not processed, and the copy defers their processing too.
+
+        """
+        tree = self.__class__()
+        Tree._update(tree, Tree._pairs(self))
+        tree._postprocess = self._postprocess
+        tree._processed = set(self._processed)
+        return tree
+
+
 class ProcessingError(Exception):
     """ Exception that will be raised, if post processor gets any error """
+
+
+class CircularReferenceError(Exception):
+    """
+    Exception that will be raised, if promise refers to itself
+
+    When the promise is created by :meth:`UpdateAction.promise`, each
+    :class:`UpdateAction` object on the reference cycle is appended to
+    the exception arguments.  So that the arguments describe the whole cycle.
+
+    """
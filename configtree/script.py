@@ -1,12 +1,15 @@
 from __future__ import print_function
 
 import os
+import sys
+import json
 import argparse
 import textwrap
 import logging
 
 from . import formatter
-from .loader import Loader, ProcessingError, UpdateAction
+from .loader import Loader, LazyTree, DependencyGraph, ProcessingError, UpdateAction
+from .loader import Profiler
 
 class CustomAppendAction(argparse.Action):
     """Custom action to append values to a list.
@@ -117,6 +120,54 @@ def ctdump(argv=None, stdout=None, stderr=None):
         action=CustomAppendAction,
         help="paths to configuration tree",
     )
+    common_options.add_argument(
+        "-e",
+        "--env",
+        metavar="<names>",
+        help="comma separated environments to dump, source files are parsed "
+        "once for all of them",
+    )
+    common_options.add_argument(
+        "-o",
+        "--output",
+        metavar="<path>",
+        help="file to write result into instead of stdout, "
+        "{env} is replaced by environment name",
+    )
+    common_options.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        metavar="<n>",
+        help="number of processes to parse files in parallel",
+    )
+    common_options.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        metavar="<n>",
+        help="number of threads to resolve expressions in parallel",
+    )
+    common_options.add_argument(
+        "-l",
+        "--lazy",
+        action="store_true",
+        help="process only keys of dumped branch",
+    )
+    common_options.add_argument(
+        "-d",
+        "--deps",
+        metavar="<key>",
+        help="print dependencies of key instead of tree",
+    )
+    common_options.add_argument(
+        "--profile",
+        nargs="?",
+        const="table",
+        choices=["table", "json"],
+        metavar="<report>",
+        help="print timings of loading into stderr: %(choices)s",
+    )
     common_options.add_argument(
         "-v", "--verbose", action="store_true", help="print debug output"
     )
@@ -158,9 +209,46 @@ def ctdump(argv=None, stdout=None, stderr=None):
         raise loader_error
     if args["verbose"]:
         logger.setLevel(logging.INFO)
+    if args["workers"] is not None:
+        load.workers = args["workers"]
+    if args["threads"] is not None:
+        load.postprocess.threads = args["threads"]
+    if args["lazy"] and not isinstance(load.tree, LazyTree):
+        load.tree = LazyTree(load.tree)
+    if args["profile"] is not None and load.profiler is None:
+        load.profiler = Profiler()
+    if args["branch"] is not None and getattr(
+        formatter.map[args["format"]], "__fingerprinted__", False
+    ):
+        # Fingerprint identifies source files of the whole tree,
+        # so it would validate a snapshot of the branch as the whole tree
+        logger.error("Branch cannot be dumped into %s format", args["format"])
+        return 1
+    envs = args["env"].split(",") if args["env"] else None
+    if envs is not None and len(envs) > 1:
+        if args["output"] is None or "{env}" not in args["output"]:
+            logger.error("Output path with {env} is required for several environments")
+            return 1
     logger.info("Loading tree from path %s", args["path"])
     try:
-        tree = load(args["path"])
+        if envs is None:
+            trees = [(None, load(args["path"]))]
+        else:
+            # Source files are parsed once for all environments
+            trees = load.batch(args["path"], envs)
+        for env, tree in trees:
+            if isinstance(tree, LazyTree):
+                tree.resolve(args["deps"] or args["branch"])
+            if args["output"] is None:
+                result = dump_tree(load, tree, args, formatter_options, stdout, logger)
+            else:
+                output = args["output"].format(env=env or "")
+                logger.info("Writing result into %s", output)
+                with open(output, "w") as out:
+                    result = dump_tree(load, tree, args, formatter_options, out, logger)
+            print_profile(load, args["profile"], stderr)
+            if result:
+                return result
     except ProcessingError as e:
         for error in e.args:
             logger.error("%s", error)
@@ -170,6 +258,16 @@ def ctdump(argv=None, stdout=None, stderr=None):
             logger.error("%s: %r", e.__class__.__name__, e.args)
             return 1
         raise  # pragma: no cover
+
+
+def dump_tree(load, tree, args, formatter_options, stdout, logger):
+    """
+    Helper function that prints loaded tree, its branch, or dependencies
+    of its key according to parsed arguments of :func:`ctdump`
+
+    """
+    if args["deps"] is not None:
+        return print_deps(load, tree, args["deps"], stdout, logger)
     if args["branch"] is not None:
         try:
             tree = tree[args["branch"]]
@@ -187,10 +285,62 @@ def ctdump(argv=None, stdout=None, stderr=None):
             for option in formatter_options[args["format"]]._group_actions
         )
 
-    # Format tree and print result
+    # Format tree and print result.  Streaming formatter writes result
+    # directly into output, so that it is not built in memory as a whole.
     logger.info("Formatting result")
-    result = formatter.map[args["format"]](tree, **formatter_args)
-    print(result, file=stdout)
+    format_tree = formatter.map[args["format"]]
+    if getattr(format_tree, "__streaming__", False):
+        out = stdout or sys.stdout
+        format_tree(tree, out=out, **formatter_args)
+        out.write("\n")
+    else:
+        if getattr(format_tree, "__fingerprinted__", False):
+            formatter_args["fingerprint"] = load.fingerprint(args["path"])
+        result = format_tree(tree, **formatter_args)
+        if isinstance(result, bytes):
+            # Binary result, e.g. snapshot, is written as is
+            out = stdout or sys.stdout
+            out.flush()
+            getattr(out, "buffer", out).write(result)
+        else:
+            print(result, file=stdout)
+
+
+def print_deps(load, tree, key, stdout, logger):
+    """
+    Helper function that prints dependencies of ``key`` for :func:`ctdump`
+
+    Each line contains a key indented by its level in dependency graph,
+    and time of its evaluation, if the key is resolved promise.
+    See :class:`configtree.loader.DependencyGraph`.
+
+    """
+    graph = getattr(load.postprocess, "graph", None) or DependencyGraph()
+    if key not in tree:
+        logger.error("Key <%s> does not exist", key)
+        return 1
+    for level, dependency in graph.walk(key):
+        line = "  " * level + dependency
+        if graph.timings.get(dependency) is not None:
+            line += "  %.3f ms" % (graph.timings[dependency] * 1000)
+        print(line, file=stdout)
+
+
+def print_profile(load, report, stderr):
+    """
+    Helper function that prints timings collected by profiler
+    of the loader for :func:`ctdump`, if ``report`` is not ``None``.
+    See :class:`configtree.loader.Profiler`.
+
+    """
+    if report is None:
+        return
+    stderr = stderr or sys.stderr
+    if report == "json":
+        json.dump(load.profiler.report(), stderr, indent=4)
+        print(file=stderr)
+    else:
+        print(load.profiler.format(), file=stderr)
 
 
 def setup_logger(stderr=None):  # pragma: no cover
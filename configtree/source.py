@@ -5,32 +5,60 @@ into :class:`collections.OrderedDict` objects.
 ..  data:: map
 
     Dictionary that stores map of loaders.  It is filled using
-    `entry points`_ named ``configtree.source``.  But can be also modified
-    within ``loaderconf.py`` module to add ad hoc loader.
+    `entry points`_ named ``configtree.source`` on first access to it.
+    But can be also modified within ``loaderconf.py`` module to add
+    ad hoc loader.
 
     The map is used by :class:`configtree.loader.Walker` to determine
     supportable files and :class:`configtree.loader.Loader` to load
     data from the files.
 
+..  data:: yaml_loaders
+
+    Dictionary that stores map of available YAML loaders by backend name.
+    The ``"python"`` backend is always available, and the ``"c"`` one
+    is available only if PyYAML is built with libyaml bindings.
+
+..  data:: yaml_backend
+
+    Name of YAML backend used by :func:`from_yaml` by default.
+    It is ``"c"`` if libyaml is available, and ``"python"`` otherwise.
+    Can be modified within ``loaderconf.py`` module.
+
 .. _entry points: https://pythonhosted.org/setuptools/setuptools.html
                   #dynamic-discovery-of-services-and-plugins
 
 """
 
-import pkg_resources
 import json
 from collections import OrderedDict
 
 import yaml
 from yaml.constructor import ConstructorError
 
+from .compat.entrypoints import EntryPointMap
+
 
 __all__ = ["map"]
 
 
-def from_yaml(data):
-    """ Loads data from YAML file into :class:`collections.OrderedDict` """
-    return yaml.load(data, Loader=OrderedDictYAMLLoader)
+def from_yaml(data, backend=None):
+    """
+    Loads data from YAML file into :class:`collections.OrderedDict`
+
+    :param data: Opened file or string to load data from
+    :param str backend: Name of YAML backend, see :data:`yaml_loaders`.
+                        By default :data:`yaml_backend` is used.
+                        If ``"c"`` backend is not available,
+                        ``"python"`` one is used instead.
+
+    """
+    backend = backend or yaml_backend
+    if backend not in yaml_loaders:
+        if backend != "c":
+            raise ValueError("Unknown YAML backend: {0!r}".format(backend))
+        backend = "python"
+    return yaml.load(data, Loader=yaml_loaders[backend])
 
 
 def from_json(data):
@@ -38,23 +66,15 @@ def from_json(data):
     return json.load(data, object_pairs_hook=OrderedDict)
 
 
-map = {}
-for entry_point in pkg_resources.iter_entry_points("configtree.source"):
-    map[entry_point.name] = entry_point.load()
+map = EntryPointMap("configtree.source")
 
 
 # The following code has been stolen from https://gist.github.com/844388
 # Author is Eric Naeseth
 
 
-class OrderedDictYAMLLoader(yaml.Loader):
-    """ A YAML loader that loads mappings into ordered dictionaries """
-
-    def __init__(self, *args, **kwargs):
-        yaml.Loader.__init__(self, *args, **kwargs)
-
-        self.add_constructor("tag:yaml.org,2002:map", type(self).construct_yaml_map)
-        self.add_constructor("tag:yaml.org,2002:omap", type(self).construct_yaml_map)
+class OrderedDictYAMLConstructor(object):
+    """ Mixin of YAML loaders that loads mappings into ordered dictionaries """
 
     def construct_yaml_map(self, node):
         data = OrderedDict()
@@ -88,3 +108,36 @@ class OrderedDictYAMLLoader(yaml.Loader):
             value = self.construct_object(value_node, deep=deep)
             mapping[key] = value
         return mapping
+
+
+class OrderedDictYAMLLoader(OrderedDictYAMLConstructor, yaml.Loader):
+    """ A YAML loader that loads mappings into ordered dictionaries """
+
+    def __init__(self, *args, **kwargs):
+        yaml.Loader.__init__(self, *args, **kwargs)
+
+        self.add_constructor("tag:yaml.org,2002:map", type(self).construct_yaml_map)
+        self.add_constructor("tag:yaml.org,2002:omap", type(self).construct_yaml_map)
+
+
+yaml_loaders = {"python": OrderedDictYAMLLoader}
+yaml_backend = "python"
+
+
+if yaml.__with_libyaml__:  # pragma: no branch
+
+    class OrderedDictCYAMLLoader(OrderedDictYAMLConstructor, yaml.CLoader):
+        """ The same as :class:`OrderedDictYAMLLoader`, but uses libyaml """
+
+        def __init__(self, *args, **kwargs):
+            yaml.CLoader.__init__(self, *args, **kwargs)
+
+            self.add_constructor(
+                "tag:yaml.org,2002:map", type(self).construct_yaml_map
+            )
+            self.add_constructor(
+                "tag:yaml.org,2002:omap", type(self).construct_yaml_map
+            )
+
+    yaml_loaders["c"] = OrderedDictCYAMLLoader
+    yaml_backend = "c"
@@ -1,34 +1,32 @@
+import pickle
 from abc import abstractmethod
-from collections import defaultdict
 
-from .compat.colabc import Mapping, MutableMapping
+from .compat.colabc import ItemsView, Mapping, MutableMapping
+from .compat.types import odict
 
 
-__all__ = ["ITree", "Tree", "flatten", "rarefy"]
+__all__ = ["ITree", "Tree", "FrozenTree", "LayeredTree", "flatten", "rarefy"]
 
 
-class ITree(MutableMapping):
+class _TreeReader(object):
     """
-    Abstract base class for :class:`Tree` and :class:`BranchProxy`.
-
-    Useful for type checking:
-
-    ..  code-block:: pycon
-
-        >>> tree = Tree({'x.y': 1})
-        >>> tree
-        Tree({'x.y': 1})
-        >>> isinstance(tree, ITree)
-        True
-        >>> tree['x']
-        BranchProxy('x'): {'y': 1}
-        >>> isinstance(tree, ITree)
-        True
+    Mixin of read-only methods shared by :class:`ITree`
+    and :class:`FrozenTree`
 
     """
 
     _key_sep = "."
 
+    def _index(self):
+        """
+        Returns pair of node of the key index that represents the tree,
+        and the tree object that stores values by full keys of the nodes.
+        The node is ``None``, if the tree is empty branch.  The pair itself
+        is ``None``, if the tree has no key index.
+
+        """
+        return None
+
     def rare_keys(self):
         """
         Returns an iterator over the first level keys.
@@ -39,7 +37,18 @@ class ITree(MutableMapping):
             >>> sorted(list(tree.rare_keys())) == ['a', 'k', 'x']
             True
 
+        If the tree has key index, i.e. it is :class:`Tree`
+        or :class:`BranchProxy`, the keys are taken from the index directly.
+        Otherwise, all keys of the tree are scanned.
+
         """
+        index = self._index()
+        if index is None:
+            return self._scan_rare_keys()
+        node = index[0]
+        return iter(()) if node is None else iter(node.children)
+
+    def _scan_rare_keys(self):
         branches = set()
         for key in self.keys():
             if self._key_sep not in key:
@@ -57,8 +66,8 @@ class ITree(MutableMapping):
         See :meth:`rare_keys`.
 
         """
-        for key in self.rare_keys():
-            yield self[key]
+        for _, value in self.rare_items():
+            yield value
 
     def rare_items(self):
         """
@@ -67,12 +76,16 @@ class ITree(MutableMapping):
         See :meth:`rare_keys`
 
         """
-        for key in self.rare_keys():
-            yield key, self[key]
-
-    @abstractmethod
-    def copy(self):
-        pass  # pragma: nocover
+        index = self._index()
+        if index is None:
+            for key in self.rare_keys():
+                yield key, self[key]
+            return
+        node, owner = index
+        if node is None:
+            return
+        for name, child in node.children.items():
+            yield name, owner[child.key] if child.leaf else owner._view(child)
 
     def rare_copy(self):
         """
@@ -87,13 +100,57 @@ class ITree(MutableMapping):
         """
         return rarefy(self)
 
-    @abstractmethod
-    def branch(self, key):
-        pass  # pragma: nocover
+    def dump_snapshot(self, f, fingerprint=""):
+        """
+        Writes snapshot of the tree into binary file object ``f``.
+        The snapshot can be loaded by :meth:`Tree.load_snapshot`.
+
+        The snapshot consists of header line, ``fingerprint`` line,
+        and pickled dictionary of the tree keys and values.
+
+        :param f: Binary file object
+        :param str fingerprint: ASCII string that identifies source of the tree,
+                                see :meth:`configtree.loader.Loader.fingerprint`
+
+        """
+        f.write(_snapshot_header)
+        f.write(fingerprint.encode("ascii") + b"\n")
+        pickle.dump(dict(self.items()), f, pickle.HIGHEST_PROTOCOL)
 
 
 _void = object()
 
+_snapshot_header = b"ConfigTree snapshot 1\n"
+
+
+class ITree(_TreeReader, MutableMapping):
+    """
+    Abstract base class for :class:`Tree` and :class:`BranchProxy`.
+
+    Useful for type checking:
+
+    ..  code-block:: pycon
+
+        >>> tree = Tree({'x.y': 1})
+        >>> tree
+        Tree({'x.y': 1})
+        >>> isinstance(tree, ITree)
+        True
+        >>> tree['x']
+        BranchProxy('x'): {'y': 1}
+        >>> isinstance(tree, ITree)
+        True
+
+    """
+
+    @abstractmethod
+    def copy(self):
+        pass  # pragma: nocover
+
+    @abstractmethod
+    def branch(self, key):
+        pass  # pragma: nocover
+
 
 class Tree(ITree):
     """
@@ -176,47 +233,162 @@ class Tree(ITree):
     """
 
     def __init__(self, data=None):
-        self._branches = defaultdict(set)
-        self._items = {}
+        self._root = _Node()
+        self._items = odict()
+        # Incremented each time nodes are removed from the key index,
+        # so that branch views can check their cached nodes
+        self._version = 0
         if data:
             self.update(data)
 
+    def _node(self, key):
+        node = self._root
+        for name in key.split(self._key_sep):
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
     def __setitem__(self, key, value):
-        if key in self._branches:
+        if key in self._items:
+            self._items[key] = value
+            return
+        path = key.split(self._key_sep)
+
+        # Remove a value set up at any of the leading keys,
+        # or a branch set up at the key itself.
+        node = self._root
+        for i, name in enumerate(path):
+            node = node.children.get(name)
+            if node is None:
+                break
+            if node.leaf:
+                del self[self._key_sep.join(path[: i + 1])]
+                break
+        else:
             del self[key]
+
         self._items[key] = value
-        if self._key_sep in key:
-            path = key.split(self._key_sep)
-            for i in range(1, len(path)):
-                lead = self._key_sep.join(path[:i])
-                tail = self._key_sep.join(path[i:])
-                if lead in self._items:
-                    del self[lead]
-                self._branches[lead].add(tail)
+        node = self._root
+        node.size += 1
+        for name in path[:-1]:
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = _Node(node.childkey(name, self._key_sep))
+            child.size += 1
+            node = child
+        # Leaf node shares the key with the items dictionary
+        child = node.children[path[-1]] = _Node(key)
+        child.size = 1
+        child.leaf = True
 
     def __getitem__(self, key):
         try:
             return self._items[key]
         except KeyError:
-            if key not in self._branches:
+            node = self._node(key)
+            if node is None:
                 raise
-            return self.branch(key)
+            return self._view(node)
+
+    def _view(self, node):
+        # Branch proxies are cached by nodes of the key index
+        view = node.view
+        if view is None:
+            view = node.view = BranchProxy(node.key, self)
+            view._cached = node
+            view._version = self._version
+        return view
 
     def __delitem__(self, key):
-        try:
+        path = key.split(self._key_sep)
+        nodes = [self._root]
+        for name in path:
+            node = nodes[-1].children.get(name)
+            if node is None:
+                raise KeyError(key)
+            nodes.append(node)
+        node = nodes[-1]
+        if node.leaf:
             del self._items[key]
-            if self._key_sep in key:
-                path = key.split(self._key_sep)
-                for i in range(1, len(path)):
-                    lead = self._key_sep.join(path[:i])
-                    tail = self._key_sep.join(path[i:])
-                    self._branches[lead].discard(tail)
-                    if not self._branches[lead]:
-                        del self._branches[lead]
-        except KeyError:
-            if key not in self._branches:
-                raise
-            self.branch(key).clear()
+        else:
+            for leaf in node.iterleaves():
+                del self._items[leaf.key]
+        size = node.size
+        for node in nodes:
+            node.size -= size
+        # Collapse emptied nodes
+        for parent, name, child in zip(nodes, path, nodes[1:]):
+            if not child.size:
+                del parent.children[name]
+                self._version += 1
+                break
+
+    def update(self, *args, **kwargs):
+        """
+        Updates the tree from a mapping or an iterable of key-value pairs,
+        and from keyword arguments, the same way as :meth:`dict.update` does.
+
+        Unlike setting up keys one by one, it walks the key index once
+        per key.  Conflicting keys, i.e. a value set up over a branch
+        or a branch set up over a value, are resolved exactly like
+        :meth:`__setitem__` does.
+
+        """
+        if len(args) > 1:
+            raise TypeError(
+                "update expected at most 1 arguments, got {0}".format(len(args))
+            )
+        if args:
+            other = args[0]
+            if isinstance(other, Tree):
+                pairs = other._pairs()
+            elif isinstance(other, Mapping):
+                pairs = other.items()
+            elif hasattr(other, "keys"):
+                pairs = ((key, other[key]) for key in other.keys())
+            else:
+                pairs = other
+            self._update(pairs)
+        if kwargs:
+            self._update(kwargs.items())
+
+    def _update(self, pairs):
+        items = self._items
+        sep = self._key_sep
+        for key, value in pairs:
+            if key in items:
+                items[key] = value
+                continue
+            path = key.split(sep)
+            node = self._root
+            nodes = [node]
+            for name in path:
+                node = node.children.get(name)
+                if node is None or node.leaf:
+                    break
+                nodes.append(node)
+            if node is not None:
+                # The key is a branch or one of its leading keys has value
+                self[key] = value
+                continue
+            items[key] = value
+            for node in nodes:
+                node.size += 1
+            for name in path[len(nodes) - 1 : -1]:  # noqa
+                child = _Node(name if node.key is None else node.key + sep + name)
+                child.size = 1
+                node.children[name] = child
+                node = child
+            child = node.children[path[-1]] = _Node(key)
+            child.size = 1
+            child.leaf = True
+
+    def _pairs(self):
+        return self._items.items()
+
+    def _index(self):
+        return self._root, self
 
     def __iter__(self):
         return iter(self._items)
@@ -228,8 +400,16 @@ class Tree(ITree):
         return "{0}({1!r})".format(self.__class__.__name__, self._items)
 
     def branch(self, key):
-        """ Returns a :class:`BranchProxy` object for specified ``key`` """
-        return BranchProxy(key, self)
+        """
+        Returns a :class:`BranchProxy` object for specified ``key``.
+        Proxies of existing branches are cached, so that the same object
+        is returned on each call until the branch is removed.
+
+        """
+        node = self._node(key)
+        if node is None or node.leaf:
+            return BranchProxy(key, self)
+        return self._view(node)
 
     def copy(self):
         """
@@ -238,6 +418,40 @@ class Tree(ITree):
         """
         return self.__class__(self)
 
+    @classmethod
+    def load_snapshot(cls, f, fingerprint=None):
+        """
+        Loads tree from binary file object ``f`` that contains snapshot
+        written by :meth:`ITree.dump_snapshot`
+
+        ..  code-block:: pycon
+
+            >>> from io import BytesIO
+            >>> f = BytesIO()
+            >>> Tree({'a.b': 1}).dump_snapshot(f, 'abc')
+            >>> f.seek(0)
+            0
+            >>> Tree.load_snapshot(f, 'abc')
+            Tree({'a.b': 1})
+
+        :param f: Binary file object
+        :param str fingerprint: Expected fingerprint of the snapshot.
+                                If it is ``None``, it is not checked.
+        :raises ValueError: if ``f`` does not contain snapshot,
+                            or its fingerprint does not match
+
+        """
+        if f.readline() != _snapshot_header:
+            raise ValueError("Snapshot of tree is expected")
+        stored = f.readline().rstrip(b"\n").decode("ascii")
+        if fingerprint is not None and stored != fingerprint:
+            raise ValueError(
+                "Snapshot fingerprint {0} does not match {1}".format(
+                    stored, fingerprint
+                )
+            )
+        return cls(pickle.load(f))
+
     def pop(self, key, default=_void):
         """
         Removes specified key and returns the corresponding value.
@@ -276,22 +490,43 @@ class BranchProxy(ITree):
     The class methods are similar to :class:`Tree` ones.
     Each method is just proxied to corresponding owner's one.
 
+    Proxies of existing branches are cached by the owner, and keep node
+    of the owner's key index.  So that repeated navigation,
+    like ``tree['a']['b']['c']``, neither creates new objects
+    nor looks the branch up from the root.  The node is looked up again,
+    when the owner's branches are removed.
+
     """
 
     def __init__(self, key, owner):
         self._key_sep = owner._key_sep
         self._key = key
         self._owner = owner
+        self._cached = None
+        self._version = None
 
     def _itemkey(self, key):
         return self._key_sep.join((self._key, key))
 
-    def keys(self):
-        if self._key not in self._owner._branches:
-            return set()
-        return self._owner._branches[self._key]
+    def _node(self):
+        owner = self._owner
+        if self._cached is not None and self._version == owner._version:
+            return self._cached
+        node = owner._node(self._key)
+        if node is None or node.leaf:
+            node = None
+        self._cached = node
+        self._version = owner._version
+        return node
 
     def __getitem__(self, key):
+        node = self._node()
+        if node is not None:
+            child = node.children.get(key)
+            if child is not None:
+                if child.leaf:
+                    return self._owner[child.key]
+                return self._owner._view(child)
         return self._owner[self._itemkey(key)]
 
     def __setitem__(self, key, value):
@@ -300,11 +535,42 @@ class BranchProxy(ITree):
     def __delitem__(self, key):
         del self._owner[self._itemkey(key)]
 
+    def __contains__(self, key):
+        node = self._node()
+        if node is not None and key in node.children:
+            return True
+        return self._itemkey(key) in self._owner
+
     def __iter__(self):
-        return iter(self.keys())
+        node = self._node()
+        if node is None:
+            return iter(())
+        start = len(self._key) + 1
+        return (leaf.key[start:] for leaf in node.iterleaves())
 
     def __len__(self):
-        return len(self.keys())
+        node = self._node()
+        return 0 if node is None else node.size
+
+    def items(self):
+        """
+        Returns view of the branch items.  Unlike default one,
+        it iterates over the owner's values without building full keys.
+
+        """
+        return _PairsView(self)
+
+    def _index(self):
+        return self._node(), self._owner
+
+    def _pairs(self):
+        node = self._node()
+        if node is None:
+            return
+        owner = self._owner
+        start = len(self._key) + 1
+        for leaf in node.iterleaves():
+            yield leaf.key[start:], owner[leaf.key]
 
     def __repr__(self):
         return "{0}({1!r}): {2!r}".format(
@@ -335,6 +601,486 @@ class BranchProxy(ITree):
         return self._owner.pop(self._itemkey(key), default)
 
 
+class _Node(object):
+    """
+    Node of the key index of :class:`Tree`.  Each node represents
+    a key part, so that the path from the root node to the current one
+    represents a key.  Values themselves are stored by :class:`Tree`.
+
+    ..  attribute:: children
+
+        Dictionary of child nodes by key parts
+
+    ..  attribute:: size
+
+        Number of keys that have values within the node subtree
+
+    ..  attribute:: leaf
+
+        Whether the node represents a key that has value
+
+    """
+
+    __slots__ = ("children", "size", "leaf", "key", "view")
+
+    def __init__(self, key=None):
+        self.children = odict()
+        self.size = 0
+        self.leaf = False
+        self.key = key
+        self.view = None
+
+    def childkey(self, name, sep):
+        """ Returns full key of the child node with passed ``name`` """
+        return name if self.key is None else sep.join((self.key, name))
+
+    def iterleaves(self):
+        """
+        Returns an iterator over nodes that have values within
+        the node subtree in depth-first order
+
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.leaf:
+                yield node
+            else:
+                stack.extend(reversed(list(node.children.values())))
+
+
+class _PairsView(ItemsView):
+    """
+    Items view that iterates over ``_pairs()`` of the mapping,
+    see :meth:`BranchProxy.items` and :meth:`FrozenTree.items`
+
+    """
+
+    def __iter__(self):
+        return self._mapping._pairs()
+
+
+class FrozenTree(_TreeReader, Mapping):
+    """
+    Immutable tree, which versions share unchanged branches with each other
+
+    The tree is built from a mapping or an iterable of key-value pairs
+    the same way as :class:`Tree` is, and converted back
+    by :class:`Tree` constructor.  Instead of item assignment and deletion,
+    methods :meth:`set` and :meth:`delete` return new versions of the tree.
+    Only nodes on the path to the changed key are copied, so that
+    copying is O(1) and update is O(depth * fanout), because dictionary
+    of children of each node on the path is copied.
+
+    ..  code-block:: pycon
+
+        >>> base = FrozenTree({'a.x': 1, 'b.y': 2})
+        >>> staging = base.set('a.x', 10)
+        >>> base['a.x'], staging['a.x']
+        (1, 10)
+        >>> Tree(staging.delete('a'))
+        Tree({'b.y': 2})
+
+    Branches are frozen trees too.  Trees are hashable, if their values are.
+
+    """
+
+    def __init__(self, data=None):
+        if isinstance(data, FrozenTree):
+            self._root = data._root
+        elif data:
+            if not isinstance(data, Tree):
+                data = Tree(data)
+            self._root = _freeze(*data._index())
+        else:
+            self._root = _empty
+        self._hash = None
+
+    @classmethod
+    def _fromnode(cls, node):
+        tree = cls.__new__(cls)
+        tree._root = node
+        tree._hash = None
+        return tree
+
+    def _find(self, key):
+        node = self._root
+        for name in key.split(self._key_sep):
+            if node.children is None:
+                return None
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def __getitem__(self, key):
+        node = self._find(key)
+        if node is None:
+            raise KeyError(key)
+        if node.children is None:
+            return node.value
+        return self._fromnode(node)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __iter__(self):
+        return (key for key, _ in self._pairs())
+
+    def __len__(self):
+        return self._root.size
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenTree) and other._root is self._root:
+            return True
+        return Mapping.__eq__(self, other)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self._pairs()))
+        return self._hash
+
+    def __repr__(self):
+        return "{0}({1!r})".format(self.__class__.__name__, dict(self._pairs()))
+
+    def items(self):
+        """ Returns view of the tree items, that iterates over nodes directly """
+        return _PairsView(self)
+
+    def _pairs(self):
+        sep = self._key_sep
+        stack = [(None, self._root)]
+        while stack:
+            key, node = stack.pop()
+            if node.children is None:
+                yield key, node.value
+                continue
+            for name, child in reversed(list(node.children.items())):
+                stack.append((name if key is None else sep.join((key, name)), child))
+
+    def rare_keys(self):
+        return iter(self._root.children)
+
+    def rare_items(self):
+        for name, child in self._root.children.items():
+            yield name, child.value if child.children is None else self._fromnode(child)
+
+    def branch(self, key):
+        """
+        Returns branch of the tree for specified ``key``.  Unlike
+        :meth:`Tree.branch`, the branch is a frozen tree, which is empty,
+        if the tree has no such branch.
+
+        """
+        node = self._find(key)
+        if node is None or node.children is None:
+            return self._fromnode(_empty)
+        return self._fromnode(node)
+
+    def copy(self):
+        """ Returns the tree itself, since it cannot be changed """
+        return self
+
+    def set(self, key, value):
+        """
+        Returns new version of the tree, where ``key`` is set up to ``value``.
+        Conflicting keys are replaced exactly like :meth:`Tree.__setitem__`
+        does, i.e. value replaces branch, and branch replaces value.
+
+        :param str key: Setting up key
+        :param value: Setting up value
+
+        """
+        path = key.split(self._key_sep)
+        # Branch nodes on the path, or ``None`` where there is no branch
+        parents = [self._root]
+        for name in path[:-1]:
+            node = parents[-1]
+            if node is not None:
+                node = node.children.get(name)
+                if node is not None and node.children is None:
+                    node = None
+            parents.append(node)
+        node = _FrozenNode(None, value, 1)
+        for name, parent in zip(reversed(path), reversed(parents)):
+            if parent is None:
+                node = _FrozenNode({name: node}, _void, node.size)
+                continue
+            children = odict(parent.children)
+            replaced = children.get(name)
+            children[name] = node
+            size = parent.size + node.size - (replaced.size if replaced else 0)
+            node = _FrozenNode(children, _void, size)
+        return self._fromnode(node)
+
+    def delete(self, key):
+        """
+        Returns new version of the tree without ``key``,
+        which can be a branch.  Emptied branches are removed too.
+
+        :param str key: Deleting key
+        :raises KeyError: if the tree has no such key
+
+        """
+        path = key.split(self._key_sep)
+        nodes = [self._root]
+        for name in path:
+            node = nodes[-1]
+            node = node.children.get(name) if node.children is not None else None
+            if node is None:
+                raise KeyError(key)
+            nodes.append(node)
+        removed = nodes[-1].size
+        node = None
+        for name, parent in zip(reversed(path), reversed(nodes[:-1])):
+            children = odict(parent.children)
+            if node is None:
+                del children[name]
+            else:
+                children[name] = node
+            node = None
+            if children:
+                node = _FrozenNode(children, _void, parent.size - removed)
+        return self._fromnode(node or _empty)
+
+
+class LayeredTree(ITree):
+    """
+    Tree, which stores only its own changes over the ``base`` one
+
+    Lookups fall through to the base tree, unless the key is changed
+    by the layered tree.  Changes follow :class:`Tree` semantics,
+    i.e. value replaces branch of the base tree, branch replaces value,
+    and deleted keys are hidden.  The base tree itself is never changed,
+    and it should not be changed by others while layered trees use it.
+
+    ..  code-block:: pycon
+
+        >>> base = Tree({'db.host': 'localhost', 'db.port': 5432})
+        >>> staging = LayeredTree(base)
+        >>> staging['db.host'] = 'staging.local'
+        >>> staging['db'] == {'host': 'staging.local', 'port': 5432}
+        True
+        >>> base['db.host']
+        'localhost'
+        >>> staging.overrides
+        Tree({'db.host': 'staging.local'})
+
+    Setting up a key to the value, which is equal to the base one
+    of the same type, stores nothing.  So that the layered tree can be
+    loaded from all the source files by :class:`configtree.loader.Loader`,
+    and it still keeps only actual overrides of the base tree.
+
+    Layered trees can be stacked, i.e. base tree can be a layered one too.
+    Values are shared with the base tree, so they should not be changed
+    in place.
+
+    Unlike :class:`Tree`, the layered one has no key index of its own,
+    so that :func:`len` and iteration over branches scan the keys.
+
+    :param ITree base: Base tree.  Other mappings are converted
+                       to :class:`Tree`.
+
+    """
+
+    def __init__(self, base=None):
+        if base is None:
+            base = Tree()
+        elif not isinstance(base, ITree):
+            base = Tree(base)
+        self.base = base
+        self._layer = Tree()
+        # Each key of masks hides the base value or branch of the key
+        self._masks = Tree()
+
+    @property
+    def overrides(self):
+        """
+        :class:`Tree` of values set up over the base tree.
+        It should not be changed directly.
+
+        """
+        return self._layer
+
+    def _masked(self, key, strict=False):
+        # Checks whether the base key is hidden by a mask set up at the key
+        # or at any of its leading keys, the key itself is skipped if strict
+        node = self._masks._root
+        if not node.children:
+            return False
+        path = key.split(self._key_sep)
+        last = len(path) - 1
+        for i, name in enumerate(path):
+            node = node.children.get(name)
+            if node is None:
+                return False
+            if node.leaf:
+                return not strict or i < last
+        return False
+
+    def _mask(self, key):
+        if not self._masked(key) and key in self.base:
+            self._masks[key] = True
+
+    def _basevalue(self, key, strict=False):
+        # Returns visible value of the base tree, or ``_void`` for branch
+        if self._masked(key, strict):
+            return _void
+        try:
+            value = self.base[key]
+        except KeyError:
+            return _void
+        return _void if isinstance(value, ITree) else value
+
+    def __getitem__(self, key):
+        try:
+            return self._layer._items[key]
+        except KeyError:
+            pass
+        if not self._masked(key):
+            try:
+                value = self.base[key]
+            except KeyError:
+                pass
+            else:
+                if not isinstance(value, ITree):
+                    return value
+        branch = _LayeredBranch(key, self)
+        for _ in branch:
+            return branch
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        layer = self._layer
+        base = self._basevalue(key, strict=True)
+        if base is not _void and type(base) is type(value) and base == value:
+            # The base value gets visible again
+            if key in layer:
+                del layer[key]
+            if key in self._masks._items:
+                del self._masks[key]
+            return
+        layer[key] = value
+        self._mask(key)
+        # Base value set up at a leading key is replaced by the branch
+        sep = self._key_sep
+        path = key.split(sep)
+        for i in range(1, len(path)):
+            prefix = sep.join(path[:i])
+            if self._basevalue(prefix) is not _void:
+                self._mask(prefix)
+                break
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in self._layer:
+            del self._layer[key]
+        self._mask(key)
+
+    def _iterkeys(self, key=None):
+        # Iterates over keys of the branch relative to the branch key,
+        # base keys go first in their order, then new keys of the layer
+        sep = self._key_sep
+        layer = self._layer if key is None else self._layer.branch(key)
+        overridden = set()
+        if key is None or not self._masked(key):
+            base = self.base
+            if key is not None:
+                base = base[key] if key in base else ()
+                if not isinstance(base, ITree):
+                    base = ()
+            items = self._layer._items
+            for tail in base:
+                full = tail if key is None else sep.join((key, tail))
+                if full in items:
+                    overridden.add(tail)
+                    yield tail
+                elif not self._masked(full):
+                    yield tail
+        for tail in layer:
+            if tail not in overridden:
+                yield tail
+
+    def __iter__(self):
+        return self._iterkeys()
+
+    def __len__(self):
+        return sum(1 for _ in self._iterkeys())
+
+    def __repr__(self):
+        return "{0}({1!r})".format(self.__class__.__name__, dict(self.items()))
+
+    def branch(self, key):
+        """
+        Returns a :class:`BranchProxy` object for specified ``key``.
+        Unlike :meth:`Tree.branch`, the proxy is created on each call.
+
+        """
+        return _LayeredBranch(key, self)
+
+    def copy(self):
+        """
+        Returns a copy of the tree, which shares the base tree with this one.
+        Only the overrides are copied.
+
+        """
+        tree = self.__class__(self.base)
+        tree._layer = self._layer.copy()
+        tree._masks = self._masks.copy()
+        return tree
+
+    def pop(self, key, default=_void):
+        """
+        Removes specified key and returns the corresponding value.
+        If key is not found, ``default`` is returned if given,
+        otherwise KeyError is raised.
+
+        If extracted value is a branch, it will be converted to :class:`Tree`.
+
+        """
+        try:
+            value = self[key]
+        except KeyError:
+            if default is _void:
+                raise
+            return default
+        if isinstance(value, BranchProxy):
+            value = value.copy()
+        del self[key]
+        return value
+
+
+class _LayeredBranch(BranchProxy):
+    """
+    Branch proxy of :class:`LayeredTree`.  Since the owner has no key index,
+    each method is proxied to the owner's one using full keys.
+
+    """
+
+    def _index(self):
+        return None
+
+    def __getitem__(self, key):
+        return self._owner[self._itemkey(key)]
+
+    def __contains__(self, key):
+        return self._itemkey(key) in self._owner
+
+    def __iter__(self):
+        return self._owner._iterkeys(self._key)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def copy(self):
+        """ Returns a shallow copy of the branch as :class:`Tree` """
+        return Tree(self)
+
+
 def flatten(d):
     """
     Generator which flattens out passed nested mapping objects.
@@ -351,12 +1097,19 @@ def flatten(d):
         Tree({'a.b.c': 1})
 
     """
-    for key, value in d.items():
-        if isinstance(value, Mapping):
-            for subkey, subvalue in flatten(value):
-                yield "{0}.{1}".format(key, subkey), subvalue
+    # Explicit stack of partially iterated mappings with their key prefixes,
+    # so that each prefix is built once per branch and deep mappings
+    # do not hit recursion limit
+    stack = [("", iter(d.items()))]
+    while stack:
+        prefix, items = stack[-1]
+        for key, value in items:
+            if isinstance(value, Mapping):
+                stack.append(("{0}{1}.".format(prefix, key), iter(value.items())))
+                break
+            yield prefix + str(key), value
         else:
-            yield str(key), value
+            stack.pop()
 
 
 def rarefy(tree):
@@ -372,17 +1125,145 @@ def rarefy(tree):
         >>> rarefy({'a.b.c' : 1})
         {'a': {'b': {'c': 1}}}
 
+    Nested dictionaries of :class:`Tree` and :class:`BranchProxy` objects
+    are built from their key index, so that keys are not split.
+
+    Branches defined by several keys are merged, e.g. ``{'a': {'b': 1},
+    'a.c': 2}``.  If a key has a value and a branch, or two values,
+    e.g. ``{'a': 1, 'a.b': 2}``, :class:`ValueError` is raised regardless
+    of order of the keys.
+
     """
+    index = tree._index() if isinstance(tree, ITree) else None
+    if index is not None and tree._key_sep == ".":
+        return _rarefy_index(*index)
     result = {}
-    for key, value in tree.items():
-        target = result
-        if "." in key:
-            keyparts = key.split(".")
-            key = keyparts.pop()
-            for keypart in keyparts:
-                target = target.setdefault(keypart, {})
-        if isinstance(value, Mapping):
-            value = rarefy(value)
-        target[key] = value
+    # Explicit stack of partially iterated mappings, full key prefixes of
+    # their keys, and dictionaries of branches cached by prefixes of keys
+    # (``None`` is for the result dictionary of the mapping).  Branches
+    # are merged and never replaced, so that the cache is always valid.
+    stack = [(iter(tree.items()), "", {None: result})]
+    while stack:
+        items, base, targets = stack[-1]
+        for fullkey, value in items:
+            prefix, sep, key = fullkey.rpartition(".")
+            prefix = prefix if sep else None
+            target = targets.get(prefix)
+            if target is None:
+                target = targets[None]
+                path = None
+                for keypart in prefix.split("."):
+                    path = keypart if path is None else path + "." + keypart
+                    target = _rarefy_branch(target, keypart, base + path)
+                    targets[path] = target
+            if isinstance(value, Mapping):
+                nested = _rarefy_branch(target, key, base + fullkey)
+                stack.append(
+                    (iter(value.items()), base + fullkey + ".", {None: nested})
+                )
+                break
+            if key in target:
+                raise _rarefy_conflict(base + fullkey)
+            target[key] = value
+        else:
+            stack.pop()
+    return result
+
+
+def _rarefy_branch(target, key, fullkey):
+    """
+    Returns dictionary of branch ``key`` of ``target``, creating it if
+    necessary.  See :func:`rarefy`.
+
+    """
+    branch = target.get(key)
+    if branch is None:
+        branch = target[key] = {}
+    elif not isinstance(branch, dict):
+        raise _rarefy_conflict(fullkey)
+    return branch
+
+
+def _rarefy_conflict(fullkey):
+    return ValueError("Key <%s> has conflicting values" % fullkey)
+
 
+def _rarefy_index(node, owner):
+    """
+    Implementation of :func:`rarefy` that walks over key index
+    starting from ``node``, and takes values from ``owner`` tree
+
+    """
+    result = {}
+    if node is None:
+        return result
+    stack = [(iter(node.children.items()), result)]
+    while stack:
+        children, target = stack[-1]
+        for name, child in children:
+            if child.leaf:
+                value = owner[child.key]
+                target[name] = rarefy(value) if isinstance(value, Mapping) else value
+            else:
+                nested = target[name] = {}
+                stack.append((iter(child.children.items()), nested))
+                break
+        else:
+            stack.pop()
     return result
+
+
+class _FrozenNode(object):
+    """
+    Node of :class:`FrozenTree`.  Nodes are never changed after creation,
+    so that they are shared between versions of the tree.
+
+    ..  attribute:: children
+
+        Dictionary of child nodes by key parts, or ``None`` for value node
+
+    ..  attribute:: value
+
+        Value of the node, or ``_void`` for branch node
+
+    ..  attribute:: size
+
+        Number of values within the node subtree
+
+    """
+
+    __slots__ = ("children", "value", "size")
+
+    def __init__(self, children, value, size):
+        self.children = children
+        self.value = value
+        self.size = size
+
+
+_empty = _FrozenNode(odict(), _void, 0)
+
+
+def _freeze(node, owner):
+    """
+    Builds :class:`_FrozenNode` objects from key index of :class:`Tree`
+    starting from ``node``, and takes values from ``owner`` tree
+
+    """
+    # Post-order traversal with explicit stack of child iterators
+    result = odict()
+    stack = [(node, iter(node.children.items()), result)]
+    while stack:
+        current, children, frozen = stack[-1]
+        for name, child in children:
+            if child.leaf:
+                frozen[name] = _FrozenNode(None, owner[child.key], 1)
+            else:
+                nested = odict()
+                stack.append((child, iter(child.children.items()), nested))
+                break
+        else:
+            stack.pop()
+            node = _FrozenNode(frozen, _void, current.size)
+            if stack:
+                stack[-1][2][current.key.rpartition(owner._key_sep)[2]] = node
+    return node
@@ -37,8 +37,15 @@ setup(
     author="Cottonwood Technology",
     author_email="info@cottonwood.tech",
     license="BSD",
-    packages=find_packages(exclude=["tests", "tests.*"]),
-    install_requires=["pyyaml", "cached-property"],
+    packages=find_packages(
+        exclude=["tests", "tests.*", "benchmarks", "benchmarks.*"]
+    ),
+    install_requires=[
+        "pyyaml",
+        "cached-property",
+        # Backport of concurrent.futures, see Loader(workers=n)
+        'futures; python_version < "3"',
+    ],
     include_package_data=True,
     zip_safe=True,
     entry_points="""\
@@ -48,6 +55,7 @@ setup(
         [configtree.formatter]
         json = configtree.formatter:to_json
         shell = configtree.formatter:to_shell
+        snapshot = configtree.formatter:to_snapshot
 
         [configtree.source]
         .json = configtree.source:from_json
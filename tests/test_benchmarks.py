@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+
+# Benchmarks are not installed with the package, they live in the repository
+root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if root not in sys.path:
+    sys.path.insert(0, root)
+
+from benchmarks import suite  # noqa
+
+
+tiny = ["--dirs", "1", "--files", "2", "--keys", "5", "--number", "1"]
+
+
+def test_suite(tmpdir, capsys):
+    saved = str(tmpdir.join("results", "baseline.json"))
+    assert suite.main(tiny + ["--save", saved]) == 0
+    with open(saved) as f:
+        results = json.load(f)
+    assert sorted(results["stages"]) == sorted(suite.stages)
+    assert results["params"]["files"] == 2
+    assert "to_json" in capsys.readouterr().out
+
+    argv = tiny + ["--compare", saved, "--threshold", "1000"]
+    assert suite.main(argv) == 0
+    out = capsys.readouterr().out
+    assert "baseline, ms" in out and "slower" not in out
+
+    # Baseline of other tree, which is much faster, shows regressions
+    results["params"]["files"] = 1
+    results["stages"] = dict((stage, 1e-9) for stage in results["stages"])
+    with open(saved, "w") as f:
+        json.dump(results, f)
+    assert suite.main(argv) == 1
+    out = capsys.readouterr().out
+    assert "Warning: baseline is measured on other tree" in out
+    assert "slower" in out
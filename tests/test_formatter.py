@@ -1,7 +1,14 @@
+import json
+from io import BytesIO
 from os import linesep
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 from configtree import formatter
-from configtree.tree import Tree
+from configtree.tree import Tree, FrozenTree
 
 
 t = Tree(
@@ -52,6 +59,24 @@ def test_json():
     ]
 
 
+def test_json_stream():
+    for params in ({}, {"indent": 4}, {"rare": True, "indent": 2, "sort": True}):
+        out = StringIO()
+        assert formatter.to_json(t, out=out, **params) is None
+        assert out.getvalue() == formatter.to_json(t, **params)
+
+    data = {"a.x": 1, "a.y": {"b.c": 2}}
+    result = formatter.to_json(data, rare=True, sort=True)
+    assert json.loads(result) == {"a": {"x": 1, "y": {"b": {"c": 2}}}}
+    result = formatter.to_json(Tree(data), rare=True, sort=True)
+    assert json.loads(result) == {"a": {"x": 1, "y": {"b": {"c": 2}}}}
+    result = formatter.to_json(FrozenTree(data), rare=True, sort=True)
+    assert json.loads(result) == {"a": {"x": 1, "y": {"b": {"c": 2}}}}
+
+    assert formatter.to_json(Tree(), indent=4) == "{}"
+    assert formatter.to_json(t["a.x"]) == "1"
+
+
 def test_shell():
     result = formatter.to_shell(
         t, prefix="local ", seq_sep=":", sort=True, capitalize=True
@@ -69,6 +94,17 @@ def test_shell():
     result = formatter.to_shell(t["a.x"], prefix="local X=")
     assert result == "local X=1"
 
+    out = StringIO()
+    assert formatter.to_shell(t, sort=True, out=out) is None
+    assert out.getvalue() == formatter.to_shell(t, sort=True)
+
+
+def test_snapshot():
+    result = formatter.to_snapshot(t, fingerprint="abc")
+    assert isinstance(result, bytes)
+    assert Tree.load_snapshot(BytesIO(result), "abc") == t
+    assert formatter.to_snapshot.__fingerprinted__
+
 
 def test_map():
     assert formatter.map["json"] == formatter.to_json
@@ -1,12 +1,17 @@
 import math
 import os
 import sys
+import time
+import threading
 
 import pytest
 
 from configtree.loader import (
     Loader,
     Pipeline,
+    ExpressionCache,
+    SourceCache,
+    SharedSources,
     Walker,
     File,
     Updater,
@@ -16,8 +21,15 @@ from configtree.loader import (
     Required,
     PostProcessor,
     ProcessingError,
+    CircularReferenceError,
+    LazyTree,
+    Profiler,
+    trigger,
 )
-from configtree.tree import Tree
+from configtree import loader
+from configtree.tree import Tree, LayeredTree
+from configtree.compat import fs
+from configtree.compat.fs import DirEntry
 
 
 data_dir = os.path.dirname(os.path.realpath(__file__))
@@ -108,6 +120,358 @@ def test_loader():
     }
 
 
+def test_loader_layered():
+    update = Updater(namespace={"floor": math.floor})
+    base = Loader(update=update)(data_dir)
+    expected = Loader(walk=Walker(env="y"), update=update)(data_dir)
+    load = Loader(walk=Walker(env="y"), update=update, tree=LayeredTree(base))
+    result = load(data_dir)
+    assert result == expected
+    assert result.base is base
+    assert sorted(result.overrides) == sorted(set(expected) - set(base))
+
+
+def test_loader_layered_environments(tmpdir):
+    tmpdir.join("defaults.yaml").write("foo: [1, 2]\nbar: [1]\n")
+    tmpdir.join("env-prod.yaml").write("foo#append: 3\n")
+    tmpdir.join("env-dev.yaml").write("bar#extend: [2]\n")
+    path = str(tmpdir)
+    base = Loader()(path)
+    prod = Loader(walk=Walker(env="prod"), tree=LayeredTree(base))(path)
+    dev = Loader(walk=Walker(env="dev"), tree=LayeredTree(base))(path)
+    assert base == {"foo": [1, 2], "bar": [1]}
+    assert prod == {"foo": [1, 2, 3], "bar": [1]}
+    assert prod.overrides == {"foo": [1, 2, 3]}
+    assert dev == {"foo": [1, 2], "bar": [1, 2]}
+    assert dev.overrides == {"bar": [1, 2]}
+
+
+def test_loader_batch():
+    update = Updater(namespace={"floor": math.floor})
+    load = Loader(walk=Walker(env="y"), update=update, reloadable=True)
+    parsed = []
+    read = load.read
+    load.read = lambda path: parsed.append(path) or read(path)
+    envs = ["", "x", "y"]
+    result = list(load.batch(data_dir, envs))
+    assert [env for env, _ in result] == envs
+    for env, tree in result:
+        expected = Loader(walk=Walker(env=env), update=update)(data_dir)
+        assert tree == expected
+    assert sorted(parsed) == sorted(set(parsed))
+    assert load.walk.params == {"env": "y"}
+    assert load.tree == {} and load.cache is None
+    with pytest.raises(ValueError):
+        load.reload()
+
+    cache = SourceCache()
+    load = Loader(walk=Walker(), update=update, cache=cache, reloadable=True)
+    assert dict(load.batch(data_dir, envs)) == dict(result)
+    assert (cache.hits, cache.misses) == (0, len(parsed))
+    assert dict(load.batch(data_dir, envs)) == dict(result)
+    assert (cache.hits, cache.misses) == (len(parsed), len(parsed))
+    assert load.cache is cache
+
+
+def test_shared_sources():
+    # Values shared by several keys, e.g. YAML aliases, are shared in copies
+    value = [1]
+    sources = SharedSources()
+    assert sources("/test/a.yaml", lambda path: [("a", value), ("b", value)])
+    pairs = sources.get("/test/a.yaml")
+    assert pairs == [("a", [1]), ("b", [1])]
+    assert pairs[0][1] is pairs[1][1] and pairs[0][1] is not value
+    assert sources.get("/test/a.yaml")[0][1] is not pairs[0][1]
+
+
+def test_loader_cache(tmpdir):
+    update = Updater(namespace={"floor": math.floor})
+    expected = Loader(walk=Walker(env="y"), update=update)(data_dir)
+
+    cache = SourceCache(str(tmpdir.join("cache")))
+    load = Loader(walk=Walker(env="y"), update=update, cache=cache)
+    assert load(data_dir) == expected
+    assert (cache.hits, cache.misses) == (0, 8)
+    assert tmpdir.join("cache").check(dir=True)
+
+    cache = SourceCache(str(tmpdir.join("cache")))
+    load = Loader(walk=Walker(env="y"), update=update, cache=cache)
+    assert load(data_dir) == expected
+    assert (cache.hits, cache.misses) == (8, 0)
+    assert not cache.modified
+
+
+def test_loader_workers(tmpdir):
+    from concurrent.futures import ThreadPoolExecutor
+
+    update = Updater(namespace={"floor": math.floor})
+    expected = Loader(walk=Walker(env="y"), update=update)(data_dir)
+
+    load = Loader(walk=Walker(env="y"), update=update, workers=2)
+    result = load([data_dir, os.path.join(data_dir, "env-z")])
+    assert list(result.items()) == list(
+        Loader(walk=Walker(env="y"), update=update)(
+            [data_dir, os.path.join(data_dir, "env-z")]
+        ).items()
+    )
+
+    with ThreadPoolExecutor(2) as executor:
+        cache = SourceCache(str(tmpdir.join("cache")))
+        for hits in (0, 8):
+            load = Loader(
+                walk=Walker(env="y"), update=update, cache=cache, workers=executor
+            )
+            assert list(load(data_dir).items()) == list(expected.items())
+            assert cache.hits == hits
+
+    assert Loader(workers=1).executor() is None
+
+
+def test_loader_reload(tmpdir):
+    path = tmpdir.join("conf")
+    path.join("a.yaml").write("x: 1\ny: \">>> self['x'] + 1\"", ensure=True)
+    path.join("b.yaml").write("z: 3")
+
+    cache = SourceCache()
+    with pytest.raises(ValueError):
+        Loader().reload()
+    load = Loader(tree=Tree({"w": 0}), cache=cache, reloadable=True)
+    with pytest.raises(ValueError):
+        load.reload()
+
+    tree = load(str(path))
+    assert tree == {"w": 0, "x": 1, "y": 2, "z": 3}
+    assert load.reload() is tree
+    assert cache.misses == 2
+
+    path.join("a.yaml").write("x: 10\ny: \">>> self['x'] + 1\"")
+    path.join("a.yaml").setmtime(path.join("a.yaml").mtime() + 10)
+    tree = load.reload()
+    assert tree == {"w": 0, "x": 10, "y": 11, "z": 3}
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    path.join("c.yaml").write("z: 30")
+    assert load.reload() == {"w": 0, "x": 10, "y": 11, "z": 30}
+
+    path.join("c.yaml").remove()
+    assert load.reload() == {"w": 0, "x": 10, "y": 11, "z": 3}
+
+    load = Loader(reloadable=True)
+    load(str(path))
+    path.join("b.yaml").remove()
+    assert load.reload() == {"x": 10, "y": 11}
+
+
+def test_loader_reload_reuse(tmpdir):
+    path = tmpdir.join("conf")
+    path.join("a.yaml").write(
+        "\n".join(
+            [
+                "x: 1",
+                "y: \">>> [self['x']]\"",
+                "z: \">>> self['y'] + [2]\"",
+                "v: \">>> self.get('x')\"",
+                "w#append: 1",
+                "t#extend: \">>> [self['x']]\"",
+            ]
+        ),
+        ensure=True,
+    )
+    path.join("b.yaml").write("u: 1")
+
+    def touch(name, content):
+        path.join(name).write(content)
+        path.join(name).setmtime(path.join(name).mtime() + 10)
+
+    load = Loader(tree=Tree({"w": [0], "t": [0]}), reloadable=True)
+    tree = load(str(path))
+    assert tree == {"x": 1, "y": [1], "z": [1, 2], "v": 1, "w": [0, 1], "t": [0, 1], "u": 1}
+    y, z = tree["y"], tree["z"]
+
+    touch("b.yaml", "u: 2")
+    tree = load.reload()
+    assert tree == {"x": 1, "y": [1], "z": [1, 2], "v": 1, "w": [0, 1], "t": [0, 1], "u": 2}
+    assert tree["y"] is y and tree["z"] is z
+    assert load.postprocess.graph.dependencies["z"] == ["y"]
+
+    touch("b.yaml", "u: 3\nx: 2")
+    tree = load.reload()
+    assert tree == {"x": 2, "y": [2], "z": [2, 2], "v": 2, "w": [0, 1], "t": [0, 2], "u": 3}
+    assert tree["y"] is not y and tree["z"] is not z
+
+    touch("b.yaml", "u: 1")
+    load = Loader(tree=LazyTree(), reloadable=True)
+    tree = load(str(path))
+    assert tree["y"] == [1]
+    touch("b.yaml", "u: 4")
+    tree = load.reload()
+    assert tree["y"] == [1] and tree["z"] == [1, 2]
+
+
+def test_loader_profiler(tmpdir):
+    path = tmpdir.join("conf")
+    path.join("a.yaml").write("x: 1\ny: \">>> self['x'] + 1\"", ensure=True)
+    path.join("b.yaml").write("z: \"$>> {self[y]}\"")
+
+    profiler = Profiler()
+    load = Loader(profiler=profiler, reloadable=True)
+    assert load(str(path)) == {"x": 1, "y": 2, "z": "2"}
+    assert list(profiler.phases) == ["walk", "parse", "update", "postprocess"]
+    assert [count for _, count in profiler.phases.values()] == [2, 2, 3, 3]
+    assert [keys for _, _, keys in profiler.files.values()] == [2, 1]
+    assert profiler.workers["Updater.eval_value"][1] == 1
+    assert profiler.workers["Updater.format_value"][1] == 1
+    assert profiler.workers["PostProcessor.resolve_promise"][1] == 3
+    assert profiler.workers["Walker.regular"][1] == 2
+
+    slowest = profiler.slowest()
+    assert sorted(key for _, key, _ in slowest) == ["y", "z"]
+    assert slowest[0][0] >= slowest[1][0]
+    assert all(isinstance(action, UpdateAction) for _, _, action in slowest)
+    assert profiler.slowest(1) == slowest[:1]
+
+    report = profiler.report(1)
+    assert [phase["name"] for phase in report["phases"]] == list(profiler.phases)
+    assert len(report["files"]) == len(report["promises"]) == 1
+    assert report["promises"][0]["action"].startswith("<tree[")
+    table = profiler.format()
+    assert "Updater.eval_value" in table and "b.yaml" in table
+
+    # Workers are instrumented once, and timings are reset on each call
+    load.reload()
+    path.join("b.yaml").remove()
+    load.reload()
+    assert profiler.workers["Updater.eval_value"][1] == 1
+    assert "Updater.format_value" not in profiler.workers
+    # Result of "y" is reused, because "x" is not changed
+    assert profiler.promises == []
+
+    # Workers are instrumented again for another profiler
+    load.profiler = Profiler()
+    load(str(path))
+    assert load.profiler.workers["Updater.eval_value"][1] == 1
+
+    # Original workers are restored, when profiling is disabled
+    load.profiler = None
+    assert load(str(path)) == {"x": 1, "y": 2}
+    for pipeline in (load.walk, load.update, load.postprocess):
+        assert not any(hasattr(w, "__profiled__") for w in pipeline.__pipeline__)
+    assert load.update._dispatch
+
+    # Promises of lazy tree are reported after access to them
+    load = Loader(tree=LazyTree(), profiler=Profiler())
+    tree = load(str(path))
+    assert load.profiler.slowest() == []
+    assert tree["y"] == 2
+    assert [key for _, key, _ in load.profiler.slowest()] == ["y"]
+
+    # Custom actors, which are not pipelines, are left as is
+    def walk(path):
+        return [os.path.join(path, "a.yaml")]
+
+    load = Loader(walk=walk, profiler=Profiler())
+    assert load(str(path)) == {"x": 1, "y": 2}
+    assert load.walk is walk
+    load.profiler = None
+    assert load(str(path)) == {"x": 1, "y": 2}
+    assert load.walk is walk
+
+
+def test_loader_snapshot(tmpdir):
+    path = tmpdir.join("conf")
+    path.join("a.yaml").write("x: 1\ny: \">>> self['x'] + 1\"", ensure=True)
+    path.join("b.yaml").write("z: 3")
+    snapshot = str(tmpdir.join("snapshot"))
+
+    load = Loader()
+    fingerprint = load.fingerprint(str(path))
+    assert load.fingerprint([str(path)]) == fingerprint
+    assert load.load_snapshot(snapshot, str(path)) == {"x": 1, "y": 2, "z": 3}
+    with open(snapshot, "rb") as f:
+        assert Tree.load_snapshot(f, fingerprint) == {"x": 1, "y": 2, "z": 3}
+
+    # Valid snapshot is loaded without loading source files
+    load = Loader()
+    assert load.load_snapshot(snapshot, str(path)) == {"x": 1, "y": 2, "z": 3}
+    assert load.tree == {}
+
+    path.join("b.yaml").write("z: 30")
+    assert load.fingerprint(str(path)) != fingerprint
+    assert load.load_snapshot(snapshot, str(path), save=False)["z"] == 30
+    with open(snapshot, "rb") as f:
+        assert Tree.load_snapshot(f)["z"] == 3
+
+    path.join("c.yaml").write("w: 0")
+    assert load.fingerprint(str(path)) != fingerprint
+
+    load = Loader(tree=LazyTree())
+    tree = load.load_snapshot(snapshot, str(path))
+    assert isinstance(tree, LazyTree)
+    tree = Loader(tree=LazyTree()).load_snapshot(snapshot, str(path))
+    assert tree == {"w": 0, "x": 1, "y": 2, "z": 30}
+
+
+def test_source_cache(tmpdir):
+    source = tmpdir.join("source.yaml")
+    source.write("x: 1")
+    cache_dir = str(tmpdir.join("cache"))
+    load = Loader().read
+
+    for checksum in (False, True):
+        cache = SourceCache(cache_dir, checksum=checksum)
+        assert cache(str(source), load) == [("x", 1)]
+        assert cache(str(source), load) == [("x", 1)]
+        assert (cache.hits, cache.misses) == (1, 1)
+        cache.save()
+
+    source.write("x: 2\ny: 3")
+    source.setmtime(source.mtime() + 10)
+    cache = SourceCache(cache_dir)
+    assert cache(str(source), load) == [("x", 2), ("y", 3)]
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # Cached values are not shared between calls
+    source = tmpdir.join("list.yaml")
+    source.write("l: []")
+    cache(str(source), load)
+    cache(str(source), load)[0][1].append(1)
+    assert cache(str(source), load) == [("l", [])]
+
+    # Values that cannot be pickled are not cached
+    source = tmpdir.join("function.yaml")
+    source.write("f: 1")
+    cache(str(source), lambda path: [("f", lambda: None)])
+    assert str(source) not in cache.entries
+    cache.save()
+
+    # Broken cache file is ignored
+    with open(cache.filename, "w") as f:
+        f.write("broken")
+    assert SourceCache(cache_dir).entries == {}
+
+
+def test_replace(tmpdir, monkeypatch):
+    src, dst = tmpdir.join("src"), tmpdir.join("dst")
+    src.write("new")
+    dst.write("old")
+    fs._rename(str(src), str(dst))
+    assert dst.read() == "new" and not src.check()
+
+    # Rename fails on Windows, if destination exists
+    def rename(src, dst, rename=os.rename):
+        if os.path.exists(dst):
+            raise OSError(dst)
+        rename(src, dst)
+
+    monkeypatch.setattr(os, "rename", rename)
+    src.write("newer")
+    with pytest.raises(OSError):
+        fs._rename(str(src), str(dst))
+    monkeypatch.setattr(os, "name", "nt")
+    fs._rename(str(src), str(dst))
+    assert dst.read() == "newer" and not src.check()
+
+
 def test_loader_fromconf():
     load = Loader.fromconf(data_dir)
     assert load.walk == "walk"
@@ -147,6 +511,30 @@ def test_pipeline():
     assert t.__pipeline__ == [t.first, t.third]
 
 
+def test_expression_cache():
+    prepared = []
+
+    def prepare(source):
+        prepared.append(source)
+        return source.upper()
+
+    cache = ExpressionCache(prepare, maxsize=2)
+    assert cache("a") == "A"
+    assert cache("b") == "B"
+    assert cache("a") == "A"
+    assert (cache.hits, cache.misses, len(cache)) == (1, 2, 2)
+
+    # The least recently used expression "b" is dropped
+    assert cache("c") == "C"
+    assert cache("a") == "A"
+    assert cache("b") == "B"
+    assert prepared == ["a", "b", "c", "b"]
+    assert (cache.hits, cache.misses, len(cache)) == (2, 4, 2)
+
+    cache.clear()
+    assert (cache.hits, cache.misses, len(cache)) == (0, 0, 0)
+
+
 def test_walker():
     walk = Walker()
     files = [os.path.relpath(f, data_dir) for f in walk(data_dir)]
@@ -214,6 +602,32 @@ def test_walker():
     ]
 
 
+def test_walker_scandir(tmpdir):
+    tmpdir.join("a.yaml").write("a: 1")
+    tmpdir.join("b.txt").write("b")
+    tmpdir.join(".hidden").write("")
+    tmpdir.mkdir("sub").join("c.json").write('{"c": 3}')
+
+    walk = Walker()
+    files = [os.path.relpath(f, str(tmpdir)) for f in walk(str(tmpdir))]
+    assert files == ["a.yaml", os.path.join("sub", "c.json")]
+    assert walk.scanned == 5
+    # a.yaml, sub, c.json: isfile + isdir; b.txt: isfile; .hidden: none
+    assert walk.entry_checks == 7
+
+    entry = next(e for e in fs.scandir(data_dir) if e.name == "default")
+    f = File(data_dir, entry.name, {}, entry)
+    assert f.entry is entry
+    assert f.isdir == True
+    assert f.isfile == False
+
+    entry = DirEntry(data_dir, "default")
+    f = File(data_dir, entry.name, {}, entry)
+    assert f.isdir == True
+    assert f.isfile == False
+    assert DirEntry(data_dir, "missing").is_dir() == False
+
+
 def test_file():
     f = File(data_dir, "default", {})
     assert f.path == data_dir
@@ -238,6 +652,26 @@ def test_file():
     assert (f1 < f2) == True
 
 
+def test_file_params():
+    params = {"env": "x.xx"}
+    f = File(data_dir, "env-x", params)
+    child = File(f.fullpath, "env-xx.yaml", f.params)
+    assert f.params == params
+    assert child.params._data is params
+
+    child.params["env"] = ""
+    assert child.params == {"env": ""}
+    assert f.params == {"env": "x.xx"}
+    assert params == {"env": "x.xx"}
+
+    del f.params["env"]
+    assert len(f.params) == 0
+    assert params == {"env": "x.xx"}
+    assert f.params.copy() == {}
+    assert repr(child.params) == "CopyOnWriteDict({'env': ''})"
+    assert not hasattr(f, "__dict__")
+
+
 def test_updater_set_default():
     tree = Tree({"foo": "bar"})
     update = Updater()
@@ -289,6 +723,24 @@ def test_updater_call_method():
     assert isinstance(tree["foo"], Promise)
     assert tree["foo"]() == [1, 2, 3, 4]
 
+    # Branches are updated in place
+    tree = Tree({"foo.a": 1, "foo.b": 2})
+    update(tree, "foo#update", {"c": 3}, "/test/source.yaml")
+    assert tree == {"foo.a": 1, "foo.b": 2, "foo.c": 3}
+
+    # Values of the tree are changed in place, values of base tree are copied
+    value = [1]
+    tree = Tree({"foo": value})
+    update(tree, "foo#append", 2, "/test/source.yaml")
+    assert tree["foo"] is value and value == [1, 2]
+    base = Tree({"foo": value, "bar": [1]})
+    tree = LayeredTree(base)
+    update(tree, "foo#append", 3, "/test/source.yaml")
+    update(tree, "foo#append", 4, "/test/source.yaml")
+    update(tree, "bar#append", ">>> 2", "/test/source.yaml")
+    assert tree["foo"] == [1, 2, 3, 4] and value == [1, 2]
+    assert tree["bar"]() == [1, 2] and base["bar"] == [1]
+
 
 def test_updater_add_method():
     update = Updater()
@@ -442,6 +894,8 @@ def test_updater_format_value():
     assert tree["x.c"]() == "1 2"
     tree["x.a"] = "foo"
     tree["x.b"] = "bar"
+    assert tree["x.c"]() == "1 2"  # Result is cached
+    update(tree, "x.c", "$>> {self[x.a]} {branch[b]}", "/test/source.yaml")
     assert tree["x.c"]() == "foo bar"
 
 
@@ -453,6 +907,8 @@ def test_updater_printf_value():
     assert tree["x.c"]() == "1 2"
     tree["x.a"] = "foo"
     tree["x.b"] = "bar"
+    assert tree["x.c"]() == "1 2"  # Result is cached
+    update(tree, "x.c", "%>> %(x.a)s %(x.b)r", "/test/source.yaml")
     assert tree["x.c"]() == "foo 'bar'"
 
 
@@ -464,9 +920,26 @@ def test_updater_eval_value():
     assert tree["x.c"]() == 2.0
     tree["x.a"] = 10.0
     tree["x.b"] = 3
+    assert tree["x.c"]() == 2.0  # Result is cached
+    update(tree, "x.c", '>>> floor(self["x.a"] / branch["b"])', "/test/source.yaml")
     assert tree["x.c"]() == 3.0
 
 
+def test_updater_expression_cache():
+    tree = Tree({"x": 1})
+    update = Updater(cache_size=2)
+    for key in ("a", "b", "c"):
+        update(tree, key, ">>> self['x'] + 1", "/test/source.yaml")
+        update(tree, key + "_f", "$>> {self[x]}", "/test/source.yaml")
+        update(tree, key + "_p", "%>> %(x)s", "/test/source.yaml")
+    PostProcessor()(tree)
+    assert tree["c"] == 2
+    assert tree["c_f"] == tree["c_p"] == "1"
+    assert (update.code_cache.hits, update.code_cache.misses) == (2, 1)
+    assert (update.template_cache.hits, update.template_cache.misses) == (4, 2)
+    assert update.code_cache.maxsize == 2
+
+
 def test_updater_required_valeue():
     tree = Tree()
     update = Updater()
@@ -479,6 +952,81 @@ def test_updater_required_valeue():
     assert repr(tree["bar"]) == "Undefined required key <bar>: Update me"
 
 
+def test_updater_dispatch(monkeypatch):
+    data = [
+        ("a", 1),
+        ("b", ">>> self['a'] + 1"),
+        ("c", "$>> {self[b]}"),
+        ("d", "%>> %(c)s"),
+        ("e", [1]),
+        ("e#append", 2),
+        ("e+", [3]),
+        ("f?", 4),
+        ("a!", 5),
+        ("g", "!!!"),
+        ("g", "plain"),
+    ]
+
+    def load(update):
+        tree = Tree()
+        for key, value in data:
+            value = list(value) if isinstance(value, list) else value
+            update(tree, key, value, "/test/source.yaml")
+        PostProcessor()(tree)
+        return tree
+
+    expected = {"a": 5, "b": 6, "c": "6", "d": "6", "e": [1, 2, 3], "f": 4, "g": "plain"}
+
+    # Plain keys and values do not create update actions
+    actions = []
+
+    class CountingAction(UpdateAction):
+        __slots__ = ()
+
+        def __init__(self, *args):
+            actions.append(args[1])
+            UpdateAction.__init__(self, *args)
+
+    monkeypatch.setattr("configtree.loader.UpdateAction", CountingAction)
+    update = Updater()
+    assert load(update) == expected
+    assert actions == ["b", "c", "d", "e#append", "e+", "f?", "a!", "g"]
+
+    # Custom worker with trigger keeps dispatching
+    class TriggeredUpdater(Updater):
+        @Pipeline.worker(75)
+        @trigger(key="~", value=["upper>> "])
+        def upper_value(self, action):
+            if action.key.endswith("~"):
+                action.key = action.key[:-1]
+            if action.value.startswith("upper>> "):
+                action.value = action.value[8:].upper()
+
+    del actions[:]
+    update = TriggeredUpdater()
+    update(Tree(), "x", "upper>> foo", "/test/source.yaml")
+    update(Tree(), "y~", "bar", "/test/source.yaml")
+    update(Tree(), "z", "baz", "/test/source.yaml")
+    assert actions == ["x", "y~"]
+
+    # Custom worker without trigger is called for each key
+    class CustomUpdater(Updater):
+        @Pipeline.worker(10)
+        def count_value(self, action):
+            counted.append(action.key)
+
+    counted = []
+    assert load(CustomUpdater()) == expected
+    assert counted == [key for key, value in data]
+
+    class EmptyUpdater(Updater):
+        set_default = call_method = add_method = not_method = None
+
+    tree = Tree()
+    EmptyUpdater()(tree, "a?", ">>> 1", "/test/source.yaml")
+    assert tree["a?"]() == 1
+
+
 def test_update_action_repr():
     action = UpdateAction(Tree(), "foo", "bar", "/test/source.yaml")
     assert repr(action) == "<tree['foo'] = 'bar' from '/test/source.yaml'>"
@@ -525,6 +1073,45 @@ def test_promise():
     assert p() == 42
 
 
+def test_promise_cache():
+    calls = []
+    p = Promise(lambda: calls.append(1) or 42)
+    assert p() == 42
+    assert p() == 42
+    assert calls == [1]
+
+
+def test_promise_cache_loading(tmpdir):
+    # Promise resolved by ``b+`` while loading must see final ``x``
+    tmpdir.join("a.yaml").write(
+        "x: 1\n"
+        "a: \">>> self['x']\"\n"
+        "b: \">>> self['a']\"\n"
+        "b+: z\n"
+    )
+    tmpdir.join("b.yaml").write("x: 2\n")
+    result = Loader()(str(tmpdir))
+    assert result == {"x": 2, "a": 2, "b": "1 z"}
+
+
+def test_promise_circular_reference():
+    tree = Tree()
+    proxy = ResolverProxy(tree)
+    tree["foo"] = Promise(lambda: proxy["bar"])
+    tree["bar"] = Promise(lambda: proxy["foo"])
+    with pytest.raises(CircularReferenceError):
+        tree["foo"]()
+
+    # Failed promise is not cached and could be resolved again
+    calls = []
+    p = Promise(lambda: calls.append(1) or int(None))
+    with pytest.raises(TypeError):
+        p()
+    with pytest.raises(TypeError):
+        p()
+    assert calls == [1, 1]
+
+
 def test_promise_resolve():
     assert Promise.resolve(Promise(lambda: 42)) == 42
     assert Promise.resolve("foo") == "foo"
@@ -550,6 +1137,222 @@ def test_postprocessor_resolve_promise():
     assert tree == {"foo": 42, "bar": "baz"}
 
 
+def test_postprocessor_resolve_promise_once():
+    calls = []
+
+    def count(value):
+        calls.append(value)
+        return value
+
+    tree = Tree()
+    update = Updater(namespace={"count": count})
+    update(tree, "a", ">>> count(1)", "/test/source.yaml")
+    for i in range(10):
+        update(tree, "b.%s" % i, ">>> self['a'] + 1", "/test/source.yaml")
+    update(tree, "c", ">>> sum(branch['b'].values())", "/test/source.yaml")
+    PostProcessor()(tree)
+    assert tree["c"] == 20
+    assert calls == [1]
+
+
+def test_postprocessor_circular_reference():
+    tree = Tree()
+    update = Updater()
+    update(tree, "foo", ">>> self['bar']", "/test/source.yaml")
+    update(tree, "bar", ">>> self['foo']", "/test/source.yaml")
+    with pytest.raises(CircularReferenceError) as info:
+        PostProcessor()(tree)
+    assert info.value.args[0] == "Circular reference detected"
+    assert [action.key for action in info.value.args[1:]] == ["bar", "foo"]
+
+
+def test_postprocessor_dependencies():
+    tree = Tree()
+    update = Updater()
+    update(tree, "c", ">>> self['b'] + str(branch['a'])", "/test/source.yaml")
+    update(tree, "b", "$>> {self[a]}", "/test/source.yaml")
+    update(tree, "a", 1, "/test/source.yaml")
+    update(tree, "x.y", "%>> %(c)s", "/test/source.yaml")
+    update(tree, "d", [1], "/test/source.yaml")
+    update(tree, "d#append", ">>> self['a']", "/test/source.yaml")
+    postprocess = PostProcessor()
+    postprocess(tree)
+    assert tree == {"c": "11", "b": "1", "a": 1, "x.y": "11", "d": [1, 1]}
+
+    graph = postprocess.graph
+    assert list(graph.dependencies.items()) == [
+        ("c", ["b", "a"]),
+        ("b", ["a"]),
+        ("x.y", ["c"]),
+        ("d", ["a"]),
+    ]
+    assert len(graph) == 4
+    assert "c" in graph and "a" not in graph
+    assert all(graph.timings[key] >= 0 for key in graph.dependencies)
+    assert list(graph.walk("x.y")) == [(0, "x.y"), (1, "c"), (2, "b"), (2, "a")]
+    assert graph.order(["x.y", "d", "c", "b", "a"]) == ["a", "b", "c", "x.y", "d"]
+
+    # Graph of the previous call is used to resolve keys in topological order
+    tree["c"] = Promise(lambda: order.append("c"))
+    tree["b"] = Promise(lambda: order.append("b"))
+    order = []
+    postprocess(tree)
+    assert order == ["b", "c"]
+    assert list(graph.dependencies) == ["b", "c"]
+
+    graph.clear()
+    assert len(graph) == 0
+    assert graph.order(["b", "a"]) == ["b", "a"]
+
+
+def test_postprocessor_threads():
+    def load(postprocess):
+        tree = Tree()
+        update = Updater(namespace={"work": work})
+        for i in range(8):
+            update(tree, "x.%s.a" % i, ">>> work(%s)" % i, "/test/source.yaml")
+            update(tree, "x.%s.b" % i, "$>> {branch[a]}!", "/test/source.yaml")
+            update(tree, "y.%s" % i, "%%>> %%(x.%s.b)s?" % i, "/test/source.yaml")
+        update(tree, "z", ">>> len(self['y.0'])", "/test/source.yaml")
+        update(tree, "w", ">>> len(self['x.0'])", "/test/source.yaml")
+        postprocess(tree)
+        return tree
+
+    def work(value):
+        threads.add(threading.current_thread())
+        time.sleep(0.01)
+        return value
+
+    threads = set()
+    expected = load(PostProcessor())
+    threads = set()
+    postprocess = PostProcessor(threads=4)
+    assert load(postprocess) == expected
+    assert len(threads) > 1
+    assert len(postprocess.graph) == len(expected)
+
+    # Errors are reported as in sequential mode
+    tree = Tree()
+    update = Updater()
+    update(tree, "a", "!!!", "/test/source.yaml")
+    update(tree, "b", ">>> self['a']", "/test/source.yaml")
+    with pytest.raises(ProcessingError) as info:
+        PostProcessor(threads=2)(tree)
+    assert info.value.args == (tree["a"],)
+
+    tree = Tree()
+    update(tree, "a", ">>> self['b']", "/test/source.yaml")
+    update(tree, "b", ">>> self['a']", "/test/source.yaml")
+    with pytest.raises(CircularReferenceError) as info:
+        PostProcessor(threads=2)(tree)
+    assert [action.key for action in info.value.args[1:]] == ["b", "a"]
+
+    # Failed expressions are not evaluated again
+    def fail(key):
+        calls.append(key)
+        raise ValueError(key)
+
+    calls = []
+    tree = Tree()
+    update = Updater(namespace={"fail": fail})
+    update(tree, "a", ">>> fail('a')", "/test/source.yaml")
+    update(tree, "b", ">>> fail('b')", "/test/source.yaml")
+    update(tree, "c", ">>> 1", "/test/source.yaml")
+    postprocess = PostProcessor(threads=3)
+    with pytest.raises(ValueError) as info:
+        postprocess(tree)
+    assert info.value.args[0] == "a" and info.value.args[1].key == "a"
+    assert sorted(calls) == ["a", "b"]
+    assert postprocess._failures == {}
+
+
+def test_promise_threads():
+    started = threading.Event()
+    finish = threading.Event()
+    calls = []
+
+    def deferred():
+        calls.append(1)
+        started.set()
+        finish.wait(5)
+        return 42
+
+    p = Promise(deferred)
+    thread = threading.Thread(target=p)
+    thread.start()
+    started.wait(5)
+    timer = threading.Timer(0.05, finish.set)
+    timer.start()
+    assert p() == 42
+    thread.join()
+    timer.join()
+    assert calls == [1]
+    assert p._lock is None
+
+
+def test_promise_lock():
+    p = Promise(lambda: 1)
+    assert p._lock is None
+    assert p() == 1 and p._lock is None
+
+    # Another thread resolves the promise, while the lock is being created
+    p = Promise(lambda: 2)
+    results = []
+    with loader._waiting_lock:
+        thread = threading.Thread(target=lambda: results.append(p()))
+        thread.start()
+        time.sleep(0.05)
+        p._result = 1
+    thread.join()
+    assert results == [1] and p._lock is None
+
+
+def test_update_action_references():
+    tree = Tree()
+
+    def references(value, key="a.b"):
+        return UpdateAction(tree, key, value, "/test/source.yaml").references
+
+    assert references(">>> self['x'] + branch['y'] * 2") == ["x", "a.y"]
+    assert references(">>> branch['y']", key="b") == ["y"]
+    assert references(">>> self.get('x')") is None
+    assert references(">>> self['x'][0]") == ["x"]
+    assert references(">>> self[key]") is None
+    assert references(">>> x[self]") is None
+    assert references(">>> (") is None
+    assert references("$>> {self[x]!r} {branch[y]:>4}") == ["x", "a.y"]
+    assert references("$>> {0}") is None
+    assert references("$>> {self[x]:{width}}") is None
+    assert references("$>> {") is None
+    assert references("%>> %(x)s %%") == ["x"]
+    assert references("foo") is None
+    assert references(42) is None
+
+
+def test_postprocessor_threads_circular_reference():
+    # References are unknown, so that the promises are resolved
+    # by different threads, which wait for each other
+    started = threading.Condition()
+    calls = set()
+
+    def deferred(key):
+        if key not in calls:
+            # Wait for the other thread, so that each one holds its promise
+            with started:
+                calls.add(key)
+                started.notify_all()
+                if len(calls) < 2:
+                    started.wait(5)
+        return proxy[key]
+
+    tree = Tree()
+    proxy = ResolverProxy(tree)
+    tree["a"] = Promise(lambda: deferred("b"))
+    tree["b"] = Promise(lambda: deferred("a"))
+    with pytest.raises(CircularReferenceError):
+        PostProcessor(threads=2)(tree)
+
+
 def test_postprocessor_check_required():
     tree = Tree({"foo": Required("foo", ""), "bar": Required("bar", "Update me")})
     postprocess = PostProcessor()
@@ -558,3 +1361,70 @@ def test_postprocessor_check_required():
         postprocess(tree)
 
     assert info.value.args == (tree["bar"], tree["foo"])
+
+
+def test_lazy_tree():
+    calls = []
+
+    def count(value):
+        calls.append(value)
+        return value
+
+    tree = LazyTree()
+    update = Updater(namespace={"count": count})
+    update(tree, "a.x", ">>> count(1)", "/test/source.yaml")
+    update(tree, "a.y", ">>> self['b.x'] + 1", "/test/source.yaml")
+    update(tree, "b.x", ">>> count(2)", "/test/source.yaml")
+    update(tree, "c.x", "!!!", "/test/source.yaml")
+    update(tree, "c.y", "!!!", "/test/source.yaml")
+    update(tree, "c.z", ">>> count(3)", "/test/source.yaml")
+    PostProcessor()(tree)
+    assert calls == []
+
+    assert tree["a"] == {"x": 1, "y": 3}
+    assert calls == [1, 2]
+    assert "x" in tree["c"]
+    assert "c.z" in tree
+    assert "c" in tree
+    assert "d" not in tree
+
+    tree.resolve("a")
+    tree.resolve("b.x")
+    with pytest.raises(ProcessingError) as info:
+        tree["c.x"]
+    assert [repr(e) for e in info.value.args] == ["Undefined required key <c.x>"]
+    with pytest.raises(ProcessingError) as info:
+        tree.resolve()
+    assert [repr(e) for e in info.value.args] == [
+        "Undefined required key <c.x>",
+        "Undefined required key <c.y>",
+    ]
+    assert calls == [1, 2, 3]
+
+    # Copy of lazy tree defers processing too, conversion to tree resolves it
+    tree = LazyTree({"a": Promise(lambda: 1), "b": Required("b")})
+    PostProcessor()(tree)
+    copy = tree.copy()
+    assert isinstance(copy, LazyTree) and isinstance(copy._items["a"], Promise)
+    assert copy["a"] == 1
+    assert isinstance(tree._items["a"], Promise)
+    assert tree["a"] == 1 and tree.copy()._items["a"] == 1
+    del tree["b"]
+    assert Tree(tree)._items == {"a": 1}
+
+    # Keys set up again are processed again
+    tree = LazyTree({"a.x": Promise(lambda: 1), "a.y": 2})
+    PostProcessor()(tree)
+    assert tree["a.x"] == 1
+    tree["a.x"] = Promise(lambda: 10)
+    assert tree["a.x"] == 10
+    tree["a.x"] = Promise(lambda: 20)
+    assert tree["a"]["x"] == 20
+    tree.update({"a.x": Promise(lambda: 30), "a.z": Promise(lambda: 3)})
+    assert tree["a"] == {"x": 30, "y": 2, "z": 3}
+    del tree["a"]
+    tree["a.x"] = Promise(lambda: 40)
+    assert tree["a.x"] == 40
+    del tree["a.x"]
+    tree["a.x"] = Promise(lambda: 50)
+    assert tree["a.x"] == 50
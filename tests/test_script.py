@@ -1,5 +1,7 @@
+import re
 import sys
 import os
+import io
 import json
 import logging
 
@@ -10,8 +12,10 @@ try:
 except ImportError:
     from io import StringIO
 
-from configtree import logger
+from configtree import logger, formatter
 from configtree.script import ctdump
+from configtree.loader import Loader
+from configtree.tree import Tree
 
 
 data_dir = os.path.dirname(os.path.realpath(__file__))
@@ -54,6 +58,49 @@ def test_ctdump():
     }
 
 
+def test_ctdump_plain_formatter(monkeypatch):
+    monkeypatch.setitem(formatter.map, "keys", lambda tree: " ".join(sorted(tree)))
+    argv = ["keys", "-p", data_dir_with_conf, "-b", "http"]
+    stdout = StringIO()
+    ctdump(argv, stdout=stdout, stderr=False)
+    assert stdout.getvalue() == "host port\n"
+
+
+def test_ctdump_workers():
+    argv = ["json", "-p", data_dir_with_conf, "-w", "2"]
+    stdout = StringIO()
+    ctdump(argv, stdout=stdout, stderr=False)
+    stdout.seek(0)
+    result = json.loads(stdout.read())
+    assert result["database.name"] == "devdb"
+
+
+def test_ctdump_threads():
+    os.environ["ENV_NAME"] = "deps"
+    argv = ["json", "-p", data_dir_with_conf, "-b", "database", "-t", "2"]
+    stdout = StringIO()
+    ctdump(argv, stdout=stdout, stderr=False)
+    result = json.loads(stdout.getvalue())
+    assert result["url"] == "mysql://root@localhost/rootdb"
+
+
+def test_ctdump_snapshot(monkeypatch):
+    monkeypatch.setitem(formatter.map, "snapshot", formatter.to_snapshot)
+    argv = ["snapshot", "-p", data_dir_with_conf]
+    stdout = io.TextIOWrapper(io.BytesIO())
+    ctdump(argv, stdout=stdout, stderr=False)
+    stdout.buffer.seek(0)
+    fingerprint = Loader.fromconf(data_dir_with_conf).fingerprint(data_dir_with_conf)
+    result = Tree.load_snapshot(stdout.buffer, fingerprint)
+    assert result["http"] == {"host": "localhost", "port": 80}
+
+    # Fingerprint of the whole tree does not fit its branch
+    stderr = StringIO()
+    result = ctdump(argv + ["-b", "http"], stderr=stderr)
+    assert result == 1
+    assert "[ERROR]: Branch cannot be dumped into snapshot format" in stderr.getvalue()
+
+
 def test_ctdump_branch():
     argv = ["json", "-p", data_dir_with_conf, "-b", "http"]
     stdout = StringIO()
@@ -90,6 +137,101 @@ def test_ctdump_processing_error():
     assert "[ERROR]: Undefined required key <http.host>" in stderr.read()
 
 
+def test_ctdump_lazy():
+    argv = ["json", "-p", data_dir_with_conf, "-b", "database", "--lazy"]
+    os.environ["ENV_NAME"] = "prod"
+    stdout = StringIO()
+    ctdump(argv, stdout=stdout, stderr=False)
+    stdout.seek(0)
+    result = json.loads(stdout.read())
+    assert result["name"] == "proddb"
+
+    argv = ["json", "-p", data_dir_with_conf, "-b", "http", "--lazy"]
+    stderr = StringIO()
+    result = ctdump(argv, stderr=stderr)
+    stderr.seek(0)
+    assert result == 1
+    assert "[ERROR]: Undefined required key <http.host>" in stderr.read()
+
+
+def test_ctdump_deps():
+    os.environ["ENV_NAME"] = "deps"
+    for lazy in ([], ["--lazy"]):
+        argv = ["json", "-p", data_dir_with_conf, "--deps", "database.url"] + lazy
+        stdout = StringIO()
+        assert ctdump(argv, stdout=stdout, stderr=False) is None
+        result = stdout.getvalue().splitlines()
+        assert [re.sub(r"  [\d.]+ ms$", "", line) for line in result] == [
+            "database.url",
+            "  database.driver",
+            "  database.user",
+            "  database.name",
+        ]
+        assert result[0].endswith(" ms") and result[3].endswith(" ms")
+
+    argv = ["json", "-p", data_dir_with_conf, "--deps", "http.port"]
+    stdout = StringIO()
+    ctdump(argv, stdout=stdout, stderr=False)
+    assert stdout.getvalue() == "http.port\n"
+
+    argv = ["json", "-p", data_dir_with_conf, "--deps", "http.nonexistent"]
+    stderr = StringIO()
+    assert ctdump(argv, stderr=stderr) == 1
+    assert "[ERROR]: Key <http.nonexistent> does not exist" in stderr.getvalue()
+
+
+def test_ctdump_profile():
+    os.environ["ENV_NAME"] = "deps"
+    argv = ["json", "-p", data_dir_with_conf, "--profile"]
+    stdout = StringIO()
+    stderr = StringIO()
+    ctdump(argv, stdout=stdout, stderr=stderr)
+    assert json.loads(stdout.getvalue())["database.name"] == "rootdb"
+    report = stderr.getvalue()
+    assert "Updater.eval_value" in report
+    assert "database.name" in report
+
+    argv = ["json", "-p", data_dir_with_conf, "--deps", "database.url"]
+    stderr = StringIO()
+    ctdump(argv + ["--profile", "json"], stdout=StringIO(), stderr=stderr)
+    report = json.loads(stderr.getvalue())
+    assert [phase["name"] for phase in report["phases"]] == [
+        "walk",
+        "parse",
+        "update",
+        "postprocess",
+    ]
+    assert sorted(promise["key"] for promise in report["promises"]) == [
+        "database.name",
+        "database.url",
+    ]
+
+
+def test_ctdump_env(tmpdir):
+    output = str(tmpdir.join("{env}.json"))
+    argv = ["json", "-p", data_dir_with_conf, "-e", "dev,deps", "-o", output]
+    assert ctdump(argv, stderr=False) is None
+    with open(output.format(env="dev")) as f:
+        assert json.load(f)["database.name"] == "devdb"
+    with open(output.format(env="deps")) as f:
+        assert json.load(f)["database.name"] == "rootdb"
+
+    argv = ["json", "-p", data_dir_with_conf, "-e", "deps", "-b", "database"]
+    stdout = StringIO()
+    ctdump(argv, stdout=stdout, stderr=False)
+    assert json.loads(stdout.getvalue())["name"] == "rootdb"
+
+    argv = ["json", "-p", data_dir_with_conf, "-e", "dev,prod", "-o", output]
+    stderr = StringIO()
+    assert ctdump(argv, stderr=stderr) == 1
+    assert "[ERROR]: Undefined required key <http.host>" in stderr.getvalue()
+
+    argv = ["json", "-p", data_dir_with_conf, "-e", "dev,deps"]
+    stderr = StringIO()
+    assert ctdump(argv, stderr=stderr) == 1
+    assert "[ERROR]: Output path with {env} is required" in stderr.getvalue()
+
+
 def test_ctdump_promise_error():
     argv = ["json", "-p", data_dir_with_conf]
     os.environ["ENV_NAME"] = "invalid"
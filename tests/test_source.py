@@ -1,6 +1,9 @@
 import os
 
+import pytest
+
 from configtree import source
+from configtree.compat.entrypoints import EntryPointMap
 from configtree.tree import flatten
 
 
@@ -15,14 +18,43 @@ def test_json():
         assert result == [("a", 1), ("b", 2), ("c.x", 1), ("c.y", 2), ("c.z", 3)]
 
 
-def test_yaml():
+@pytest.mark.parametrize("backend", [None, "python", "c"])
+def test_yaml(backend):
     with open(os.path.join(data_dir, "test.yaml")) as f:
-        result = source.from_yaml(f)
+        result = source.from_yaml(f, backend=backend)
         result = list(flatten(result))
         assert result == [("a", 1), ("b", 2), ("c.x", 1), ("c.y", 2), ("c.z", 3)]
 
 
+def test_yaml_backend(monkeypatch):
+    assert source.yaml_loaders["python"] == source.OrderedDictYAMLLoader
+    if "c" in source.yaml_loaders:
+        assert source.yaml_backend == "c"
+
+    monkeypatch.delitem(source.yaml_loaders, "c", raising=False)
+    monkeypatch.setattr(source, "yaml_backend", "c")
+    assert source.from_yaml("{b: 1, a: 2}") == {"b": 1, "a": 2}
+
+    with pytest.raises(ValueError):
+        source.from_yaml("{}", backend="invalid")
+
+
 def test_map():
     assert source.map[".yml"] == source.from_yaml
     assert source.map[".yaml"] == source.from_yaml
     assert source.map[".json"] == source.from_json
+
+
+def test_map_lazy():
+    registry = EntryPointMap("configtree.source")
+    assert registry._data is None
+    registry[".ini"] = source.from_json
+    assert registry._data is not None
+    assert sorted(registry) == [".ini", ".json", ".yaml", ".yml"]
+    assert len(registry) == 4
+    assert ".ini" in registry
+    assert repr(registry).startswith("EntryPointMap(")
+
+    del registry[".ini"]
+    assert ".ini" not in registry
+    assert registry[".yaml"] == source.from_yaml
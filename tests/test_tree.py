@@ -1,11 +1,19 @@
+import sys
+from collections import OrderedDict
+from io import BytesIO
+
 import pytest
 
-from configtree.tree import Tree, flatten, rarefy
+from configtree.tree import ITree, Tree, FrozenTree, LayeredTree, flatten, rarefy
+from configtree.compat.colabc import Mapping
 
 
 @pytest.fixture
 def td():
-    return Tree({"1": 1, "a.2": 2, "a.b.3": 3, "a.b.4": 4, "a.b.5": 5, "a.b.6": 6})
+    # Pairs keep order of keys on Python versions with unordered dict
+    return Tree(
+        [("1", 1), ("a.2", 2), ("a.b.3", 3), ("a.b.4", 4), ("a.b.5", 5), ("a.b.6", 6)]
+    )
 
 
 def test_read_write():
@@ -108,6 +116,34 @@ def test_rare_iterators(td):
     assert sorted(list(td["a"].rare_items()), key=key) == [("2", 2), ("b", td["a.b"])]
 
 
+def test_rare_iterators_index(td):
+    assert list(td.rare_keys()) == ["1", "a"]
+    assert list(td.rare_items()) == [("1", 1), ("a", td["a"])]
+    assert list(td["a"].rare_values()) == [2, td["a.b"]]
+
+    empty = td.branch("x")
+    assert list(empty.rare_keys()) == []
+    assert list(empty.rare_items()) == []
+    assert rarefy(empty) == {}
+
+
+class DictTree(OrderedDict, ITree):
+    """ Tree without key index, i.e. plain dictionary of full keys """
+
+    branch = None
+
+
+def test_rare_iterators_scan():
+    tree = DictTree([("a.x", 1), ("k", 2), ("a.y", 3)])
+    assert list(tree.rare_keys()) == ["a", "k"]
+    with pytest.raises(KeyError):
+        list(tree.rare_items())
+    tree = DictTree([("a", 1), ("k", 2)])
+    assert list(tree.rare_items()) == [("a", 1), ("k", 2)]
+    assert list(tree.rare_values()) == [1, 2]
+    assert rarefy(DictTree({"a.x": 1, "k": 2})) == {"a": {"x": 1}, "k": 2}
+
+
 def test_repr():
     td = Tree()
 
@@ -175,6 +211,49 @@ def test_override_branch():
     assert td["x"] == {"y.1": 1}
 
 
+def test_update():
+    pairs = [
+        ("a.b.c", 1),
+        ("a.b.d", 2),
+        ("x", 3),
+        ("a.b", 4),
+        ("x.y.z", 5),
+        ("a.b.e", 6),
+        ("a.f", 7),
+        ("x", 8),
+        ("a.f", 9),
+    ]
+    expected = Tree()
+    for key, value in pairs:
+        expected[key] = value
+
+    td = Tree(pairs)
+    assert list(td.items()) == list(expected.items())
+    assert td == {"a.b.e": 6, "a.f": 9, "x": 8}
+    assert len(td["a"]) == 2
+    assert len(td["a.b"]) == 1
+
+    td = Tree({"a.b": 1})
+    td.update({"a.b.c": 2}, y=3)
+    assert td == {"a.b.c": 2, "y": 3}
+
+    class Keys(object):
+        def keys(self):
+            return ["a"]
+
+        def __getitem__(self, key):
+            return 4
+
+    td.update(Keys())
+    assert td == {"a": 4, "y": 3}
+
+    td.update(Tree({"z.1": 5}))
+    assert td == {"a": 4, "y": 3, "z.1": 5}
+
+    with pytest.raises(TypeError):
+        td.update({}, {})
+
+
 def test_get_value():
     td = Tree()
 
@@ -204,6 +283,35 @@ def test_get_branch():
     assert "y" in bx
 
 
+def test_branch_views(td):
+    branch = td["a"]
+    assert td["a"] is branch
+    assert td.branch("a") is branch
+    assert branch["b"] is td["a.b"]
+    assert list(branch) == ["2", "b.3", "b.4", "b.5", "b.6"]
+    assert list(branch.items()) == [
+        ("2", 2),
+        ("b.3", 3),
+        ("b.4", 4),
+        ("b.5", 5),
+        ("b.6", 6),
+    ]
+    assert ("b.3", 3) in branch.items()
+
+    # Views are valid after the branch is removed and set up again
+    del td["a"]
+    assert len(branch) == 0
+    assert list(branch.items()) == []
+    assert "2" not in branch
+    branch["x"] = 1
+    assert td["a"] == {"x": 1}
+    assert branch["x"] == 1
+    td["a"] = 2
+    assert list(branch) == []
+    with pytest.raises(KeyError):
+        branch["x"]
+
+
 def test_delete_value(td):
     del td["a.b.4"]
     del td["a.b.5"]
@@ -227,16 +335,207 @@ def test_delete_branch(td):
     assert "a" not in td
 
 
+def test_delete_branch_value(td):
+    del td["a"]["b.3"]
+    del td["a.b"]["4"]
+    assert td == {"1": 1, "a.2": 2, "a.b.5": 5, "a.b.6": 6}
+
+
+def test_empty_branch():
+    td = Tree({"x": 1})
+    assert len(td.branch("y")) == 0
+    assert list(td.branch("y")) == []
+    assert len(td.branch("x")) == 0  # Value is not a branch
+    assert list(td.branch("x")) == []
+
+
+def test_override_deep_branch():
+    td = Tree({"a.b.c.d": 1, "a.b.x": 2, "a.y": 3})
+
+    td["a.b.c.d.e"] = 4
+    assert td == {"a.b.c.d.e": 4, "a.b.x": 2, "a.y": 3}
+    assert len(td["a"]) == 3
+
+    td["a.b"] = 5
+    assert td == {"a.b": 5, "a.y": 3}
+    assert "a.b.c" not in td
+    assert len(td["a"]) == 2
+
+    del td["a.b"]
+    del td["a.y"]
+    assert td == {}
+    assert len(td.branch("a")) == 0
+    assert "a" not in td
+
+
 def test_delete_key_error():
     td = Tree()
     with pytest.raises(KeyError):
         del td["x"]
 
 
+def test_snapshot(td):
+    f = BytesIO()
+    td.dump_snapshot(f, "abc")
+    f.seek(0)
+    result = Tree.load_snapshot(f, "abc")
+    assert isinstance(result, Tree)
+    assert result == td
+
+    f.seek(0)
+    assert Tree.load_snapshot(f) == td
+
+    f.seek(0)
+    with pytest.raises(ValueError):
+        Tree.load_snapshot(f, "xyz")
+
+    f = BytesIO()
+    td["a.b"].dump_snapshot(f)
+    f.seek(0)
+    assert Tree.load_snapshot(f, "") == {"3": 3, "4": 4, "5": 5, "6": 6}
+
+    with pytest.raises(ValueError):
+        Tree.load_snapshot(BytesIO(b'{"a": 1}'))
+
+
+def test_frozen_tree(td):
+    ft = FrozenTree(td)
+    assert ft == td
+    assert len(ft) == len(td)
+    assert sorted(ft) == sorted(td)
+    assert isinstance(ft, Mapping) and not isinstance(ft, ITree)
+    assert ft.copy() is ft
+    assert FrozenTree(ft) == ft
+    assert FrozenTree() == {}
+    assert Tree(ft) == td
+    assert FrozenTree([("a", 1), ("a.c", 2)]) == Tree([("a", 1), ("a.c", 2)])
+    assert repr(FrozenTree({"x.y": 1})) == "FrozenTree({'x.y': 1})"
+
+    assert ft["a.b.3"] == 3
+    assert ft["a"]["b"] == {"3": 3, "4": 4, "5": 5, "6": 6}
+    assert isinstance(ft["a.b"], FrozenTree)
+    assert "a.b" in ft and "a.b.7" not in ft and "1.x" not in ft
+    with pytest.raises(KeyError):
+        ft["a.x"]
+    assert ft.branch("a.b") == ft["a.b"]
+    assert ft.branch("x") == {} and ft.branch("1") == {}
+    assert list(ft.rare_keys()) == ["1", "a"]
+    assert list(ft.rare_values()) == [1, ft["a"]]
+    assert rarefy(ft) == rarefy(td)
+
+    with pytest.raises(TypeError):
+        ft["1"] = 2
+    with pytest.raises(TypeError):
+        del ft["1"]
+
+    new_ft = ft.set("a.b.3", 30)
+    assert new_ft["a.b.3"] == 30 and ft["a.b.3"] == 3
+    assert new_ft["a.2"] == 2
+    assert new_ft.set("a.b", 0) == {"1": 1, "a.2": 2, "a.b": 0}
+    assert new_ft.set("1.x", 0)["1"] == {"x": 0}
+    assert len(new_ft.set("x.y.z", 0)) == len(ft) + 1
+
+    assert ft.delete("a.b") == {"1": 1, "a.2": 2}
+    assert ft.delete("a.2").delete("a.b") == {"1": 1}
+    assert ft.delete("a").delete("1") == {}
+    with pytest.raises(KeyError):
+        ft.delete("a.x")
+    with pytest.raises(KeyError):
+        ft.delete("1.x")
+    assert ft == td
+
+    assert hash(ft) == hash(FrozenTree(td))
+    assert hash(ft) != hash(new_ft)
+    assert len(set([ft, FrozenTree(td), new_ft])) == 2
+    with pytest.raises(TypeError):
+        hash(FrozenTree({"x": [1]}))
+
+
+def test_layered_tree(td):
+    lt = LayeredTree(td)
+    assert lt == td
+    assert len(lt) == len(td)
+    assert list(lt) == list(td)
+    assert lt.base is td
+    assert isinstance(lt, ITree)
+    assert LayeredTree() == {}
+    assert LayeredTree({"x.y": 1}).base == Tree({"x.y": 1})
+    assert repr(LayeredTree({"x.y": 1})) == "LayeredTree({'x.y': 1})"
+
+    # Equal values are not stored
+    lt["a.b.3"] = 3
+    lt["1"] = 1.0
+    assert lt.overrides == {"1": 1.0}
+    lt["1"] = 1
+    assert lt.overrides == {}
+
+    lt["a.b.3"] = 30
+    lt["a.b.7"] = 7
+    assert lt["a.b.3"] == 30 and td["a.b.3"] == 3
+    assert lt["a"]["b"] == {"3": 30, "4": 4, "5": 5, "6": 6, "7": 7}
+    assert list(lt["a.b"]) == ["3", "4", "5", "6", "7"]
+    assert len(lt["a.b"]) == 5
+    assert isinstance(lt["a.b"], ITree)
+    assert "b.7" in lt["a"] and "a.b.7" not in td
+    assert lt.overrides == {"a.b.3": 30, "a.b.7": 7}
+    assert list(lt["a"].rare_keys()) == ["2", "b"]
+    assert list(lt.branch("1")) == [] and list(lt.branch("x")) == []
+    with pytest.raises(KeyError):
+        lt["x"]
+
+    # Value replaces base branch, and branch replaces base value
+    lt["a.b"] = 0
+    assert lt == {"1": 1, "a.2": 2, "a.b": 0}
+    lt["1.x"] = 1
+    assert lt["1"] == {"x": 1}
+    with pytest.raises(KeyError):
+        lt["a.b.3"]
+    lt["1"] = 1
+    assert lt == {"1": 1, "a.2": 2, "a.b": 0}
+    assert lt.overrides == {"a.b": 0}
+
+    # Deleted keys are hidden
+    del lt["a.b"]
+    del lt["a.2"]
+    assert lt == {"1": 1}
+    with pytest.raises(KeyError):
+        lt["a"]
+    with pytest.raises(KeyError):
+        del lt["a.b"]
+    lt.branch("a.b")["3"] = 3
+    assert lt == {"1": 1, "a.b.3": 3}
+    assert lt.pop("a") == Tree({"b.3": 3})
+    assert lt.pop("a", None) is None
+    with pytest.raises(KeyError):
+        lt.pop("a")
+    assert lt == {"1": 1}
+    assert td == {"1": 1, "a.2": 2, "a.b.3": 3, "a.b.4": 4, "a.b.5": 5, "a.b.6": 6}
+
+    # Layers can be stacked and copied
+    staging = LayeredTree(td)
+    staging["a.b.3"] = 30
+    region = LayeredTree(staging)
+    region["a.b.4"] = 40
+    assert region["a.b"] == {"3": 30, "4": 40, "5": 5, "6": 6}
+    assert region.overrides == {"a.b.4": 40}
+    copy = region.copy()
+    del copy["a.b"]
+    assert copy == {"1": 1, "a.2": 2} and region["a.b.4"] == 40
+    assert region["a"].copy() == Tree({"2": 2, "b.3": 30, "b.4": 40, "b.5": 5, "b.6": 6})
+    assert rarefy(region) == {"1": 1, "a": {"2": 2, "b": {"3": 30, "4": 40, "5": 5, "6": 6}}}
+
+
 def test_flatten():
     fd = dict(flatten({"a": {"b": {"c": {1: 1, 2: 2}}}}))
     assert fd == {"a.b.c.1": 1, "a.b.c.2": 2}
 
+    deep = value = {}
+    for i in range(sys.getrecursionlimit() * 2):
+        value = {"x": value, "y": i}
+    deep = dict(flatten(value))
+    assert len(deep) == sys.getrecursionlimit() * 2
+    assert deep["y"] == sys.getrecursionlimit() * 2 - 1
+
 
 def test_rarefy():
     rd = rarefy(Tree({"a.b.c": 1, "x.y.z": 1}))
@@ -244,3 +543,31 @@ def test_rarefy():
 
     rd = rarefy({"a.b.c": {"x.y.z": 1}})
     assert rd == {"a": {"b": {"c": {"x": {"y": {"z": 1}}}}}}
+
+    rd = rarefy({"b.c": {"d": 1}, "b.c.e": 2, "b.f": 3})
+    assert rd == {"b": {"c": {"d": 1, "e": 2}, "f": 3}}
+    rd = rarefy(OrderedDict([("b.c.e", 2), ("b.c", {"d": 1}), ("b.f", 3)]))
+    assert rd == {"b": {"c": {"d": 1, "e": 2}, "f": 3}}
+    rd = rarefy({"a.b": 1, "a": {"c": 2}, "a.d": 3})
+    assert rd == {"a": {"b": 1, "c": 2, "d": 3}}
+    for pairs in ([("a.b", 1), ("a", 2)], [("a", 2), ("a.b", 1)]):
+        with pytest.raises(ValueError) as info:
+            rarefy(OrderedDict(pairs))
+        assert str(info.value) == "Key <a> has conflicting values"
+    for pairs in ([("a", {"c": 2}), ("a.c", 3)], [("a.c", 3), ("a", {"c": 2})]):
+        with pytest.raises(ValueError) as info:
+            rarefy(OrderedDict(pairs))
+        assert str(info.value) == "Key <a.c> has conflicting values"
+
+    depth = sys.getrecursionlimit() * 2
+    rd = rarefy({"x." * depth + "y": 1})
+    for i in range(depth):
+        rd = rd["x"]
+    assert rd == {"y": 1}
+    value = 1
+    for i in range(depth):
+        value = {"x": value}
+    rd = rarefy(value)
+    for i in range(depth):
+        rd = rd["x"]
+    assert rd == 1